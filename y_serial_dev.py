@@ -265,17 +265,79 @@ _______________ TABLE OF CONTENTS:
    - Preface with quick example
    - Usage with SUMMARY of CLASSES, METHODS, and FUNCTIONS:
 
+     Pool:
+          _______________ Keep open connections keyed by path and tuning.
+          get( self, db, timeout, isolation, tune=None ):
+               Check out an open connection to db, else make a new one.
+          put( self, db, con ):
+               Return a committed connection to the pool for reuse.
+          clear( self, db=None ):
+               Close idle connections for db, or for all databases if None.
+     Bell:
+          _______________ Wake threads waiting for a commit in this process.
+          ring( self ):
+               Count a commit and wake all waiting threads.
+          wait( self, rings, seconds ):
+               Wait up to seconds unless rung since count rings; get count.
      Base:
           _______________ Attributes and methods for database setup.
                Set path to database for all instances; db0 is default.
                Connection and execution methods.
-     Insertion( Base ):
+               POOL attribute: pooled connections, else connect per call.
+               PROFILE attribute: named pragma profile, e.g. WAL journal.
+               SPLIT attribute: notes and pzblob in separate tables.
+          createtable( self, table=tab0, split=None ):
+               Columns created: key ID, unix time, notes, and pzblob.
+          ttltable( self, table=tab0 ):
+               Add expiry column texp to table, its index t_exp, and view t_live.
+          liverig( self, table=tab0, split=False ):
+               Rig view t_live: objects of table, less rows expired by texp.
+          caprig( self, table=tab0, split=False ):
+               Rig t_cap holding caps and running blob bytes, kept by triggers.
+          evict( self, table=tab0 ):
+               Within a session: delete oldest rows over the caps in t_cap; count.
+          ensureindex( self, column='notes', table=tab0 ):
+               Index column (notes or tunix) of table unless already done.
+          claim( self, table, suffix ):
+               Raise IOError if name t_suffix is taken, but not by a companion.
+          rows( self, sql, parlist=[] ):
+               Connect, execute sql, get list of raw rows (tuples, not decoded).
+       *  session( self ):
+               One connection and transaction for many calls, see Session.
+          block( self, attempt, timeout=None, ready=None ):
+               Call attempt() until ready, waiting for commits; timeout secs.
+     Session:
+          _______________ Group many operations into a single transaction.
+               with I.session() as s:  ... s.insert(...); s.fifo(...) ...
+     Util:
+          _______________ Utility methods for keys, subquery, comma
+          lastsub( self, m, table ):
+               Subquery and parameter list for the last m kids in table.
+          comma2list( self, csvstr, wild=True ):
+               Convert comma separated values to a parameter list.
+          andsub( self, subquery ):
+               Turn a plain "WHERE ..." subquery into "AND ( ... )", else None.
+          commasub( self, csvstr, table=Base.tab0, wild=True ):
+               Subquery and parameter list: notes match comma separated values.
+          commaplan( self, csvstr, table=Base.tab0, wild=True ):
+               Subquery, parameter list, and the path taken for each term.
+          explaincomma( self, csvstr, table=Base.tab0, wild=True ):
+               Paths taken per term, and SQLite's EXPLAIN QUERY PLAN details.
+          tagsof( self, notes ):
+               List distinct tags (each prefixed by "#") found in notes.
+          ftsquery( self, csvstr ):
+               Convert comma separated words to an FTS5 query, all required.
+          sample( self, patterns, table=Base.tab0 ):
+               Count matches of each GLOB pattern among latest SAMPLE notes.
+     Insertion( Base, Util ):
           _______________ INSERT pz BLOB into DATABASE
-          inbatch( self, objseq, table=Base.tab0 ):
+          inbatch( self, objseq, table=Base.tab0, ttl=None ):
                Pickle and compress sequence of annotated objects; insert.
        *  ingenerator( self, generate_objnotes, table=Base.tab0 ):
-               Pickle and compress via generator function, then insert.
-      **  insert( self, obj, notes='#0notes', table=Base.tab0 ):
+               Pickle and compress via generator, insert chunk by chunk.
+          inpz( self, pzrows, table=Base.tab0, ttl=None ):
+               Insert rows [notes, pzblob] in one transaction; get kid range.
+      **  insert( self, obj, notes='#0notes', table=Base.tab0, ttl=None ):
                Pickle and compress single object; insert with annotation.
      Annex( Insertion ):
           _______________ Add macro-objects (files, URL content) to DATABASE
@@ -293,14 +355,14 @@ _______________ TABLE OF CONTENTS:
                Get time in unix seconds of the last insert.
           lastdate( self, table=Base.tab0 ):
                Get local date/time of the last insert.
-     Util:
-          _______________ Utility methods for keys, subquery, comma
-          comma2list( self, csvstr, wild=True ):
-               Convert comma separated values to a parameter list.
      Deletion( Base, Util ):
           _______________ Deletion methods; also used for queue POP 
           deletesub( self, subquery, parlist=[], table=Base.tab0 ):
                Delete row(s) matching the subquery.
+          deletechunks( self, subquery, parlist=[], table=Base.tab0, kid=0, progress=None, chunk=None ):
+               Delete rows matching "WHERE ..." subquery in kid windows; resumable.
+          expire( self, table=Base.tab0, n=None ):
+               Delete up to n (REAPN) rows whose expiry texp has passed; count.
           deletekid( self, kid, table=Base.tab0 ):
                Delete single row with primary key kid.
           deletecomma( self, csvstr, table=Base.tab0, wild=True ):
@@ -313,18 +375,52 @@ _______________ TABLE OF CONTENTS:
           _______________ SUBQUERY table, get dictionary. POP QUEUE.
           dicsub(self, subquery='', parlist=[], table=Base.tab0, POP=False):
                Subquery table to get objects into response dictionary.
+          popsub( self, subquery='', parlist=[], table=Base.tab0 ):
+               Retrieve and delete rows matching subquery, atomically.
           diclast( self, m=1, table=Base.tab0, POP=False ):
-               Get dictionary with last m consecutive kids in table.
+               Get dictionary with last m kids in table.
           diccomma( self, csvstr, table=Base.tab0, wild=True, POP=False ):
                Get dictionary where notes match comma separated values.
        *  selectdic( self, dual=1, table=Base.tab0, POP=False ):
                Alias "selectdic":  diclast  OR diccomma.
+          notessub(self, subquery='', parlist=[], table=Base.tab0):
+               Get dictionary kid: [tunix, notes] of rows matching subquery.
+          kidsub(self, subquery='', parlist=[], table=Base.tab0):
+               Get sorted list of kids of rows matching subquery.
+          countsub(self, subquery='', parlist=[], table=Base.tab0):
+               Count the rows matching subquery.
+          notescomma( self, csvstr, table=Base.tab0, wild=True ):
+               Get kid: [tunix, notes] where notes match comma separated values.
+          kidcomma( self, csvstr, table=Base.tab0, wild=True ):
+               Get sorted kids where notes match comma separated values.
+       *  countcomma( self, csvstr, table=Base.tab0, wild=True ):
+               Count rows where notes match comma separated values.
+          itersub(self, subquery='', parlist=[], table=Base.tab0, recentfirst=False):
+               Iterate (kid, tunix, notes, obj) matching subquery, by kid.
+          iterlast( self, m=1, table=Base.tab0 ):
+               Iterate the last m kids in table, by kid.
+       *  itercomma( self, csvstr, table=Base.tab0, wild=True, recentfirst=False ):
+               Iterate rows where notes match comma separated values.
+          rangesub( self, t1=None, t2=None, table=Base.tab0 ):
+               Subquery and parameter list for t1 <= tunix < t2, indexed.
+          dicrange( self, t1=None, t2=None, table=Base.tab0, POP=False ):
+               Get dictionary of rows inserted from time t1 until t2.
+          iterrange( self, t1=None, t2=None, table=Base.tab0, recentfirst=False ):
+               Iterate (kid, tunix, notes, obj) inserted from t1 until t2.
+          countrange( self, t1=None, t2=None, table=Base.tab0 ):
+               Count rows inserted from time t1 until t2.
+          ftssub( self, query, table=Base.tab0, POP=False ):
+               Get dictionary of rows whose notes match the FTS5 query.
+          ftscomma( self, csvstr, table=Base.tab0, POP=False ):
+               Get dictionary where notes contain all comma separated words.
+          iterfts( self, query, table=Base.tab0, m=None ):
+               Iterate (kid, tunix, notes, obj) matching FTS5 query, best first.
      Display( Subquery ):
           _______________ View subquery via pretty print
           viewsub(self, subquery='', parlist=[], table=Base.tab0, POP=False):
                Subquery, order keys, and print qualified dictionary.
           viewlast( self, m=1, table=Base.tab0, POP=False ):
-               Print last m consecutive kids in table.
+               Print last m kids in table.
           viewcomma(self, csvstr='', table=Base.tab0, wild=True, POP=False):
                Print dictionary where notes match comma separated values.
        *  view( self, dual=1, table=Base.tab0, POP=False ):
@@ -341,27 +437,65 @@ _______________ TABLE OF CONTENTS:
                Alias "select":  omaxlast OR omaxcomma.
        *  getkid( self, kid, table=Base.tab0, POP=False ):
                Retrieve a row given primary key kid, POP optional.
+          getkids( self, kids, table=Base.tab0, POP=False ):
+               Retrieve rows for a list of kids at once: (objs, missing).
      Oldest( Latest ):
           _______________ Retrieve the oldest qualified object "omin" 
+          ominsub(self, subquery='', parlist=[], table=Base.tab0, POP=False):
+               Get the oldest object omin which matches subquery.
           ominfirst( self, n=0, table=Base.tab0, POP=False ):
                Most quickly get the oldest n-th object using key index.
-       *  fifo( self, table=Base.tab0 ):
+          omincomma( self, csvstr, table=Base.tab0, wild=True, POP=False ):
+               Get oldest object where notes match comma separated values.
+       *  fifo( self, table=Base.tab0, timeout=0 ):
                FIFO queue: return oldest object, then POP (delete) it.
      Care( Answer, Deletion ):
           _______________ Maintenance methods
-          freshen( self, freshdays=None, table=Base.tab0 ):
+          freshen( self, freshdays=None, table=Base.tab0, chunk=0 ):
                Delete rows in table over freshdays-old since last insert.
           vacuum( self ):
                Defrag entire database, i.e. all tables therein.
                     - why VACUUM?
-       *  clean( self, freshdays=None, table=Base.tab0 ):
+          autovacuum( self, mode='INCREMENTAL' ):
+               Set auto_vacuum mode: NONE, FULL or INCREMENTAL (VACUUM to convert).
+          incremental_vacuum( self, pages=None ):
+               Free up to pages (None: all) free pages, VACSTEP at a time; count.
+          compact_to( self, path ):
+               Write a defragmented copy of the database to path (VACUUM INTO).
+       *  clean( self, freshdays=None, table=Base.tab0, chunk=0 ):
                Delete stale rows after freshdays; vacuum/defrag database.
+          splittable( self, table=Base.tab0 ):
+               Migrate table to the split layout, moving pzblob to t_pz.
+          tagindex( self, table=Base.tab0 ):
+               Index tags of notes in side table t_tag, kept up by insert.
+          triindex( self, table=Base.tab0 ):
+               Index trigrams of notes in FTS5 table t_tri, kept up by triggers.
+          ftsindex( self, table=Base.tab0 ):
+               Index words of notes in FTS5 table t_fts, kept up by triggers.
+          captable( self, table=Base.tab0, maxrows=None, maxbytes=None ):
+               Cap table at maxrows rows and/or maxbytes of pzblob; evict oldest.
      Main( Annex, Oldest, Care ):
           _______________ Summary for use of a single database.
+     Queue( Main ):
+          _______________ Work queue: batches, leases, ack/nack, dead letters.
+          queuetable( self, table=Base.tab0 ):
+               Create queue table, or convert a table; with t_dead, index.
+          enqueue( self, objseq, table=Base.tab0, prio=0, delay=0 ):
+               Insert sequence of (obj, notes), ready after delay; kid range.
+       *  dequeue( self, n=1, table=Base.tab0, lease=None, timeout=0 ):
+               Lease up to n ready objects: list of (receipt, notes, obj).
+          bury( self, kids, now, table=Base.tab0 ):
+               Move rows with given kids to the dead-letter table t_dead.
+       *  ack( self, receipts, table=Base.tab0 ):
+               Done with leased objects: delete them; count those still leased.
+          nack( self, receipts, table=Base.tab0, delay=0 ):
+               Hand leased objects back, ready again after delay seconds.
+          reschedule( self, subquery='', parlist=[], table=Base.tab0, delay=0, prio=None ):
+               Make rows matching subquery ready after delay; count them.
      copysub( subquery, parlist, tablex, tabley, dbx=Base.db0, dby=Base.db0 ):
           Subselect from tablex, then copy to tabley (in another database).
      copylast( m, tablex, tabley, dbx=Base.db0, dby=Base.db0 ):
-          Copy last m consecutive kids in tablex over to tabley.
+          Copy last m kids in tablex over to tabley.
    * comma( *string_args ):
           Join string-type arguments with comma (cf. csvstr, comma2list).
      copycomma( csvstr, tablex, tabley, dbx=Base.db0, dby=Base.db0, wild=True ):
@@ -369,6 +503,24 @@ _______________ TABLE OF CONTENTS:
   ** copy( dual, tablex, tabley, dbx=Base.db0, dby=Base.db0, wild=True ):
           Alias "copy":  copylast OR copycomma
 
+     Compactor( threading.Thread ):
+          _______________ Background thread: vacuum databases on a schedule.
+          __init__( self, dbs, interval=interval, pages=pages, convert=True ):
+               Set databases to compact every interval secs; convert to INCREMENTAL.
+          compact( self ):
+               One round: incremental vacuum of each database; pages freed.
+          stop( self, timeout=None ):
+               Stop after the current round; wait up to timeout secs for it.
+     Reaper( threading.Thread ):
+          _______________ Background thread: delete expired rows in batches.
+          __init__( self, targets, interval=interval, n=Deletion.REAPN ):
+               Set (db, table) pairs to reap of expired rows, n rows per batch.
+          reap( self ):
+               One round: a batch from each target; count rows deleted.
+          metrics( self ):
+               Get dictionary: rows reaped, seconds, rows reclaimed per second.
+          stop( self, timeout=None ):
+               Stop after the current round; wait up to timeout secs for it.
      Farm:
           _______________ Start a farm of databases for concurrency and scale.
           __init__( self, dir=dir0, maxbarns=barns0 ):
@@ -379,6 +531,8 @@ _______________ TABLE OF CONTENTS:
                After farmin, reap dual under tablex barn(n) by size expectation.
           cleanfarm( self, freshdays=None, table=Base.tab0 ):
                Delete stale rows after freshdays; vacuum/defrag barns.
+          compactor( self, interval=Compactor.interval, pages=Compactor.pages ):
+               Start a Compactor thread for all barns, instead of inline vacuum.
         * plant( self, obj, notes='#0notes', table=Base.tab0, dby=Base.db0 ):
                FARM SUMMARY: farmin insert with generic self-cleaning harvest.
 
@@ -391,11 +545,78 @@ _______________ TABLE OF CONTENTS:
           Test class Main for bugs. 
    - testfarm( dir=Farm.dir0, maxbarns=Farm.barns0 ):
           Test class Farm for bugs. Include path for directory.
+   - benchprofiles( dir='/tmp', noobs=2000 ):
+          Benchmark insert and select throughput for each PRAGMA profile.
+   - benchtrigram( dir='/tmp', sizes=( 1000000, 10000000 ), probes=20 ):
+          Benchmark infix comma search latency without and with triindex.
+   - benchqueue( dir='/tmp', noobs=20000, consumers=( 1, 4, 16 ), n=100 ):
+          Benchmark Queue throughput for several consumer processes.
    - Acknowledgements and Revised BSD LICENCE
 
 
 _______________  CHANGE LOG
 
+  !! 2026-10-18  v0.80:  (development)
+                         Added Pool of open connections used by class Base;
+                              set Base.POOL = False for connect per call.
+                         Added PRAGMA profiles (durable, throughput,
+                              bulk-load) selected by Base.PROFILE;
+                              pooled connections are kept per profile.
+                         Insertion caches tables known to exist (see
+                              Base.known), so insert is one transaction.
+                         Added session: many calls, one commit at exit.
+                         ingenerator now streams: commits every CHUNK rows
+                              or CHUNKBYTES, returns rows and kid range.
+                         Added itersub, itercomma, iterlast: stream rows.
+                         omax*/omin* let SQLite find the single row by
+                              ORDER BY kid LIMIT 1, decoding only that;
+                              *last and ominfirst no longer presume
+                              consecutive kids.  Added ominsub, omincomma.
+                         Added notes*, kid*, count* methods (sub and comma)
+                              for metadata only, never reading pzblob.
+                         Optional split layout (Base.SPLIT, splittable):
+                              notes scans no longer walk blob pages.
+                         Opt-in tag index (Care.tagindex): comma terms
+                              which are #tags use the (tag, kid) index.
+                         Opt-in trigram index (Care.triindex): infix
+                              comma terms like '*paris*' use FTS5 trigrams.
+                         Opt-in full-text search (Care.ftsindex): ftssub,
+                              ftscomma, iterfts ranked by BM25.
+                         commasub orders GLOB terms by sampled selectivity
+                              (Util.SAMPLE), rarest first.
+                         Base.ensureindex for notes or tunix; anchored
+                              comma terms use a range of the notes index.
+                              Util.explaincomma shows the path taken.
+                         Added dicrange, iterrange, countrange: time
+                              ranges on a tunix index created on demand.
+                         Added getkids: many kids in a few queries.
+                         POP is atomic (popsub): DELETE ... RETURNING,
+                              else SELECT and DELETE in one session.
+                         Added class Queue: enqueue, dequeue with leases,
+                              ack, nack, redelivery, dead-letter table;
+                              receipts carry a random token per delivery.
+                         fifo and dequeue take a timeout to block until a
+                              commit brings an object (Base.block, Bell).
+                         Queue priorities and delayed delivery (enqueue
+                              prio, delay); bulk Queue.reschedule.
+                         Chunked deletion (Deletion.deletechunks) commits
+                              each kid window, yields, reports progress,
+                              resumes; opt in by freshen or clean chunk.
+                         Care.autovacuum, paced incremental_vacuum (used by
+                              clean when INCREMENTAL), compact_to by VACUUM
+                              INTO.  Farm.compactor: background Compactor
+                              thread instead of inline vacuum in plant.
+                         Per-object ttl at insert (column texp, index t_exp):
+                              reads skip expired rows via view t_live;
+                              Deletion.expire and Reaper thread reclaim them.
+                         Capped tables (Care.captable, t_cap): each insert
+                              evicts the oldest rows over maxrows/maxbytes.
+                         pz objects start with a codec byte: raw for small
+                              or incompressible pickles, else zlib;
+                              legacy pz objects still load.
+                              !! Readers older than v0.80 cannot load
+                              objects or pzdump files written by v0.80.
+
      2015-04-22  v0.70:  Code review to fix tester.
                          Default database db0 in class Base now uses /tmp.
                          Character set change from iso-8859-1 to utf-8.
@@ -428,7 +649,7 @@ _______________  CHANGE LOG
                     which also archives prior change log.
 
   !! = indicates change(s) which broke backward compatibility.
-  pz = pickled zlib compressed binary format.
+  pz = pickled zlib compressed binary format (v0.80: codec byte, see pzdumps).
 
 
 _______________ TODO List
@@ -445,6 +666,8 @@ from version 2.3.2 in Python 2.5 to version 2.4.1 in Python 2.6.
           sqlite.connect(":memory:", check_same_thread = False)
 
      However, their docs omit this option.  --Noted 2010-05-24  
+     Pooled connections are opened that way, since the Pool hands
+     each one to a single caller at a time.  --Noted 2026-10-18
 
 [ ] - update code for Python version 3.x
 
@@ -461,6 +684,9 @@ from version 2.3.2 in Python 2.5 to version 2.4.1 in Python 2.6.
 
 #  _______________ Variable settings with imports
 
+from __future__ import with_statement
+#  ^for Python v2.5 only, which needs it for "with I.session() as s:".
+
 DEBUG = False
 #  Here's how to EXECUTE TESTS. First, be sure to change the default 
 #  database file to suit yourself; see assignment db0 in class Base.
@@ -502,15 +728,228 @@ compress_level  = 7
 #       1 is fastest and produces the least compression, 
 #       9 is slowest and produces the greatest compression. 
 
+compress_min    = 128
+#               pickles shorter than this many bytes are stored raw:
+#       zlib's own header and checksum would eat most of the gain.
+compress_ratio  = 0.9
+#               stored raw unless zlib shrinks the pickle at least this much.
+compress_probe  = 4096
+#               pickles over 4 times this long are probed first: if their
+#       first compress_probe bytes hardly shrink at level 1, the whole is
+#       taken for incompressible (e.g. a JPEG via infile) and stored raw.
+
+codec_raw  = '\x00'
+codec_zlib = '\x01'
+#  The first byte of a pz object names its codec.  Legacy pz objects 
+#  (before v0.80) are bare zlib streams, which always start with 'x' 
+#  (0x78), so they never collide with these and still load.
+#  !! Not the other way around: pzloads before v0.80 knows no codec byte,
+#     so it cannot load rows nor pzdump files written from v0.80 on.
+
 def pzdumps( obj ):
-     '''Pickle object, then compress the pickled.'''
-     return zlib.compress( yPickle.dumps(obj, pickle_protocol), compress_level)
-     #      as binary string.
+     '''Pickle object, then compress the pickled unless it does not pay.'''
+     pickled = yPickle.dumps( obj, pickle_protocol )
+     size = len( pickled )
+     if size < compress_min:
+          return codec_raw + pickled
+     if size > 4 * compress_probe:
+          probe = zlib.compress( pickled[:compress_probe], 1 )
+          if len( probe ) > compress_ratio * compress_probe:
+               return codec_raw + pickled
+     zipped = zlib.compress( pickled, compress_level )
+     if len( zipped ) > compress_ratio * size:
+          return codec_raw + pickled
+     return codec_zlib + zipped
+     #      as binary string, headed by its codec byte.
 
 def pzloads( pzob ):
      '''Inverse of pzdumps:  decompress pz object, then unpickle.'''
-     return yPickle.loads( zlib.decompress( pzob ) )  
-     #              ^auto-detects pickle protocol.
+     codec = pzob[0]
+     if codec == codec_zlib:
+          return yPickle.loads( zlib.decompress( buffer( pzob, 1 ) ) )
+     if codec == codec_raw:
+          return yPickle.loads( str( pzob[1:] ) )
+     return yPickle.loads( zlib.decompress( pzob ) )
+     #  ^legacy pz object, see codec_raw.      ^auto-detects pickle protocol.
+
+
+#       __________ POOL of open connections
+
+import os
+import time
+import threading
+
+class Connection( ysql.Connection ):
+     '''sqlite3 connection which can carry pool bookkeeping attributes.'''
+     pass
+     #  The C-level connection has no __dict__, so this trivial subclass
+     #  (passed as factory to connect) lets us note pid and idle time.
+
+
+class Pool:
+     '''_______________ Keep open connections keyed by path and tuning.'''
+     #  Opening a connection means opening the file, reading its header
+     #  and parsing the schema -- for small objects that costs more than
+     #  the insert or select itself.  So we check connections out of the
+     #  pool, and put them back after commit (or after the read is done).
+     #  A checked out connection belongs to exactly one caller, which is
+     #  why it is safe to open them with check_same_thread=False.
+     #  Pragmas such as cache_size, mmap_size and synchronous stick to a
+     #  connection, so connections are pooled by (db, tune) where tune is
+     #  (PROFILE, SYNCHRONOUS) of the instance -- a connection tuned for
+     #  bulk-load never goes to an instance which expects the defaults.
+
+     size = 5
+     #      ^maximum number of idle connections kept per (db, tune).
+     idle = 60
+     #      ^seconds: an idle connection older than this gets closed.
+
+     def __init__( self, size=size, idle=idle ):
+          '''Set size and idle timeout for the pool.'''
+          self.size = size
+          self.idle = idle
+          self.lock = threading.Lock()
+          self.reset()
+
+     def reset( self ):
+          '''Forget every pooled connection, e.g. after os.fork().'''
+          self.cons = {}
+          self.pid  = os.getpid()
+          #  Never close connections inherited across fork: SQLite must not
+          #  carry an open connection into a child.  We merely drop them.
+
+     def get( self, db, timeout, isolation, tune=None ):
+          '''Check out an open connection to db, else make a new one.'''
+          now = time.time()
+          con = None
+          self.lock.acquire()
+          try:
+               if self.pid != os.getpid():
+                    self.reset()
+               stack = self.cons.get( ( db, tune ), [] )
+               while stack:
+                    con = stack.pop()
+                    if now - con.tlast < self.idle:
+                         break
+                    con.close()
+                    con = None
+          finally:
+               self.lock.release()
+          if con is None:
+               con = ysql.connect( db, timeout = timeout,
+                                       isolation_level = isolation,
+                                       check_same_thread = False,
+                                       factory = Connection )
+               con.pid     = os.getpid()
+               con.timeout = timeout
+               con.tune    = None
+               #             ^pragmas not yet applied, see Base.connect.
+          elif con.timeout != timeout:
+               con.execute( 'PRAGMA busy_timeout = %d' % (timeout * 1000) )
+               con.timeout = timeout
+          con.isolation_level = isolation
+          return con
+
+     def put( self, db, con ):
+          '''Return a committed connection to the pool for reuse.'''
+          con.tlast = time.time()
+          self.lock.acquire()
+          try:
+               if con.pid == self.pid == os.getpid():
+                    stack = self.cons.setdefault( ( db, con.tune ), [] )
+                    if len( stack ) < self.size:
+                         stack.append( con )
+                         return
+          finally:
+               self.lock.release()
+          if con.pid == os.getpid():
+               con.close()
+
+     def clear( self, db=None ):
+          '''Close idle connections for db, or for all databases if None.'''
+          self.lock.acquire()
+          try:
+               keys = [ k for k in self.cons.keys()
+                              if db is None or k[0] == db ]
+               for key in keys:
+                    for con in self.cons.pop( key, [] ):
+                         if con.pid == os.getpid():
+                              con.close()
+          finally:
+               self.lock.release()
+
+pool = Pool()
+#  ^the one pool shared by all instances in this process.  Tune it by, e.g.
+#         y_serial.pool.size = 20
+#         y_serial.pool.idle = 300
+
+
+
+class Bell:
+     '''_______________ Wake threads waiting for a commit in this process.'''
+     #  Every commit rings the bell (see Base.proceed and Session), so a
+     #  consumer blocked in Base.block wakes at once when a producer in
+     #  the same process commits.  Commits by other processes are seen
+     #  by polling PRAGMA data_version instead.
+
+     def __init__( self ):
+          '''Start with no rings.'''
+          self.cond  = threading.Condition()
+          self.rings = 0
+
+     def ring( self ):
+          '''Count a commit and wake all waiting threads.'''
+          self.cond.acquire()
+          try:
+               self.rings += 1
+               self.cond.notifyAll()
+          finally:
+               self.cond.release()
+
+     def wait( self, rings, seconds ):
+          '''Wait up to seconds unless rung since count rings; get count.'''
+          self.cond.acquire()
+          try:
+               if self.rings == rings:
+                    self.cond.wait( seconds )
+               return self.rings
+          finally:
+               self.cond.release()
+
+bell = Bell()
+#  ^the one bell shared by all instances in this process.
+
+
+#       __________ PRAGMA profiles applied once per connection
+
+profiles = {
+     'durable'   : [ ('journal_mode', 'WAL'),
+                     ('synchronous',  'FULL') ],
+     'throughput': [ ('journal_mode', 'WAL'),
+                     ('synchronous',  'NORMAL'),
+                     ('cache_size',   -16384),
+                     ('mmap_size',    268435456),
+                     ('temp_store',   'MEMORY') ],
+     'bulk-load' : [ ('page_size',    8192),
+                     ('journal_mode', 'WAL'),
+                     ('synchronous',  'OFF'),
+                     ('cache_size',   -65536),
+                     ('mmap_size',    268435456),
+                     ('temp_store',   'MEMORY') ]  }
+#  Each profile is an ordered list of (pragma, value) pairs, see Base.PROFILE.
+#
+#  WAL (write-ahead log) lets readers proceed while a writer holds its
+#  IMMEDIATE lock, and a commit costs one fsync of the log instead of
+#  several for the rollback journal.  journal_mode=WAL is persistent:
+#  it is recorded in the database file itself.
+#       synchronous NORMAL under WAL is still safe against application
+#       crashes, but a power failure may roll back the last commits.
+#       synchronous OFF trusts the operating system entirely -- only for
+#       bulk loads which can be repeated from scratch.
+#  cache_size is negative for KiB (rather than pages); mmap_size in bytes
+#  lets reads come straight from the memory-mapped file.  page_size only
+#  takes effect for a brand new database file (before WAL is engaged).
+#  Add your own profile to this dictionary as needed.
 
 
 
@@ -539,6 +978,10 @@ class Base:
      #        See _The Definitive Guide to SQLite_, chapters 4 and 5, 
      #        by Michael Owens (2006, Apress) for the clearest explanation.
 
+     RETURNING = ysql.sqlite_version_info >= ( 3, 35, 0 )
+     #  DELETE ... RETURNING, so that POP takes rows in one statement;
+     #  older SQLite uses SELECT then DELETE within a session.
+
      TIMEOUT  = 14
      #          ^ in seconds (default: 5)
      #  During multiple concurrent sessions, writing creates a certain type 
@@ -547,71 +990,918 @@ class Base:
      #  an exception.  Increase the wait if a very large amount of objects 
      #  is routinely inserted during a single session.
 
+     POOL     = True
+     #  True:  reuse open connections from the module's pool (see class Pool),
+     #         which spares the connect and schema parse on every call.
+     #  False: connect and close on every call, as y_serial always did,
+     #         so that the database file is let go of immediately.
+
+     PROFILE  = None
+     #  None leaves SQLite defaults alone (rollback journal).  Otherwise
+     #  name a key of the module's "profiles" dictionary, e.g. 'throughput',
+     #  whose pragmas are applied once per connection.
+
+     SYNCHRONOUS = None
+     #  None keeps the synchronous level of the PROFILE, else overrides it
+     #  with one of: 'OFF', 'NORMAL', 'FULL', 'EXTRA'.
+
      def __init__( self, db=db0 ):
           '''Set path to database for all instances; db0 is default.'''
           self.db = db
 
+     con      = None
+     #  Set only on the instance handed out by a Session (see session),
+     #  where every method runs on that one connection and transaction.
+
+     def connect( self ):
+          '''Get a connection to the database, pooled unless POOL is False.'''
+          if self.con is not None:
+               return self.con
+          tune = ( self.PROFILE, self.SYNCHRONOUS )
+          if self.POOL:
+               con = pool.get( self.db, self.TIMEOUT, self.TRANSACT, tune )
+          else:
+               con = ysql.connect( self.db,    timeout = self.TIMEOUT,
+                                       isolation_level = self.TRANSACT,
+                                       factory = Connection )
+               con.tune = None
+          if con.tune != tune:
+               self.pragmas( con )
+               con.tune = tune
+               #  ^once per connection: the pool keys on tune, so a pooled
+               #   connection never needs settings of another profile undone.
+          return con
+
+     def pragmas( self, con ):
+          '''Apply PROFILE pragmas, then any SYNCHRONOUS override.'''
+          pairs = []
+          if self.PROFILE:
+               pairs += profiles[ self.PROFILE ]
+          if self.SYNCHRONOUS:
+               pairs += [ ('synchronous', self.SYNCHRONOUS) ]
+          for pragma, value in pairs:
+               con.execute( 'PRAGMA %s = %s' % (pragma, value) ).fetchall()
+               #                 fetch, since journal_mode answers ^
+
+     def release( self, con, broken=False ):
+          '''Give back connection: to the pool, else close it.'''
+          if con is self.con:
+               return
+               #  ^the Session will commit or roll back, then release.
+          if self.POOL and not broken:
+               con.rollback()
+               #  ^whatever was left uncommitted, e.g. a write through rows,
+               #   must not pass on to the next caller with its write lock.
+               #   (no statement at all when nothing is pending.)
+               pool.put( self.db, con )
+          else:
+               con.close()
+               #   ^ very important to release lock for concurrency.
+
      def proceed( self, sql, parlist=[[]] ):
-          '''Connect, executemany, commit, then finally close.'''
+          '''Connect, executemany, commit, then release connection.'''
+          con = None
           try:
-               con = ysql.connect( self.db,    timeout = self.TIMEOUT, 
-                                       isolation_level = self.TRANSACT )
+               con = self.connect()
                cur = con.cursor()
-               cur.executemany( sql, parlist )
-               #        for an empty ^parameter list, use [[]].
-               con.commit()
-               #   ^MUST remember to commit! else the data is rolled back! 
+               try:
+                    changes = con.total_changes
+                    cur.executemany( sql, parlist )
+                    #        for an empty ^parameter list, use [[]].
+                    if self.con is None:
+                         con.commit()
+                         if con.total_changes != changes:
+                              bell.ring()
+                         #  ^only when rows were written: a waiter woken
+                         #   for nothing would try again at once, see block.
+                    #   ^MUST remember to commit! else the data is rolled back!
+                    #    (but within a session, commit waits until its exit.)
+               finally:
+                    cur.close()
           except:
+               if con is not None:
+                    self.release( con, broken=True )
+                    #  closing discards whatever was not committed;
+                    #  a session's connection is left for its exit.
                a = " !! Base.proceed did not commit. [Check db path.] \n"
                b = "             Suspect busy after TIMEOUT,          \n"
                c = "             tried this sql and parameter list:   \n"
                raise IOError, "%s%s%s%s\n%s" % ( a, b, c, sql, parlist )
+          self.release( con )
+
+     def session( self ):
+          '''One connection and transaction for many calls, see Session.'''
+          return Session( self )
+
+     POLL = ( 0.001, 0.01 )
+     #  block polls PRAGMA data_version first after POLL[0] seconds, then
+     #  backs off, doubling the pause up to POLL[1] seconds -- the worst
+     #  latency to notice a commit by another process.
+
+     def block( self, attempt, timeout=None, ready=None ):
+          '''Call attempt() until ready, waiting for commits; timeout secs.'''
+          #  attempt is tried once, then again whenever the database has
+          #  changed, until ready( got ) (default: got is not None) or
+          #  timeout seconds have passed (None: wait for ever).
+          #  The last result of attempt() is returned either way.
+          if self.con is not None:
+               a = " !! Base.block: not within a session, whose write lock \n"
+               b = "             keeps out the very commit waited for."
+               raise IOError, a + b
+          if ready is None:
+               ready = lambda got: got is not None
+          if timeout is not None:
+               deadline = time.time() + timeout
+          watch = ysql.connect( self.db, timeout=self.TIMEOUT,
+                                check_same_thread=False )
+          #  ^its own connection: data_version changes whenever any other
+          #   connection commits, including our pooled ones.
+          try:
+               version = watch.execute( 'PRAGMA data_version' ).fetchone()[0]
+               rings   = bell.rings
+               #  ^both read before the attempt, so no commit slips past.
+               while True:
+                    got = attempt()
+                    if ready( got ):
+                         return got
+                    pause = self.POLL[0]
+                    while True:
+                         if timeout is None:
+                              seconds = pause
+                         else:
+                              seconds = min( pause, deadline - time.time() )
+                              if seconds <= 0:
+                                   return got
+                         rung = bell.wait( rings, seconds )
+                         now  = watch.execute( 'PRAGMA data_version' ).fetchone()[0]
+                         if rung != rings or now != version:
+                              rings, version = rung, now
+                              break
+                         pause = min( 2 * pause, self.POLL[1] )
           finally:
-               cur.close()
-               con.close()
-               #   ^ very important to release lock for concurrency.
+               watch.close()
 
      def respond( self, klass, sql, parlist=[] ):
           '''Connect, execute select sql, get response dictionary.'''
+          con = None
           try:
-               con = ysql.connect( self.db,    timeout = self.TIMEOUT, 
-                                       isolation_level = self.TRANSACT )
+               con = self.connect()
                cur = con.cursor()
-               response = {}
-               for tupler in cur.execute( sql, parlist ):
-                    self.responder( klass, tupler, response )
-               #         ^ to be defined in a subclass
-               #           (mostly to process output from subqueries).
-               #  con.commit() intentionally omitted.
+               try:
+                    response = {}
+                    for tupler in cur.execute( sql, parlist ):
+                         self.responder( klass, tupler, response )
+                    #         ^ to be defined in a subclass
+                    #           (mostly to process output from subqueries).
+                    #  con.commit() intentionally omitted.
+               finally:
+                    cur.close()
+                    #   ^resets the statement, so no read lock lingers
+                    #    while the connection idles in the pool.
           except:
+               if con is not None:
+                    self.release( con, broken=True )
                a = " !! Base.respond choked, probably because     \n"
                b = "             object feels out of context.     \n"
                c = "           Tried this sql and parameter list: \n"
                raise IOError, "%s%s%s%s\n%s" % (a, b, c, sql, parlist)
-          finally:
-               cur.close()
-               con.close()
+          self.release( con )
           return response
 
-     def createtable( self, table=tab0 ):
+     def rows( self, sql, parlist=[] ):
+          '''Connect, execute sql, get list of raw rows (tuples, not decoded).'''
+          con = None
+          try:
+               con = self.connect()
+               cur = con.cursor()
+               try:
+                    rows = cur.execute( sql, parlist ).fetchall()
+               finally:
+                    cur.close()
+          except:
+               if con is not None:
+                    self.release( con, broken=True )
+               a = " !! Base.rows choked on this sql and parameter list: \n"
+               raise IOError, "%s%s\n%s" % ( a, sql, parlist )
+          self.release( con )
+          return rows
+          #  Nothing is committed: for writes, use within a session;
+          #  outside of one, they are rolled back on release.
+
+     SPLIT    = False
+     #  Layout for tables which createtable makes from now on:
+     #  False: a single table (kid, tunix, notes, pzblob), as always.
+     #  True:  a narrow table (kid, tunix, notes) that notes are searched
+     #         in, and a companion table t_pz (kid, pzblob) keyed by kid.
+     #  Every method works against either layout; see also splittable.
+
+     def createtable( self, table=tab0, split=None ):
           '''Columns created: key ID, unix time, notes, and pzblob.'''
+          if split is None:
+               split = self.SPLIT
           a = 'CREATE TABLE IF NOT EXISTS %s' % table
           b = '(kid INTEGER PRIMARY KEY, tunix INTEGER,'
           c = 'notes TEXT, pzblob BLOB)'
-          sql = ' '.join( [a, b, c] )
           try:
-               self.proceed( sql )
-               #  try construct is useful for portability in standard 
-               #  cases where clause "IF NOT EXISTS" is not implemented.
+               if not split:
+                    self.proceed( ' '.join( [a, b, c] ) )
+                    #  try construct is useful for portability in standard 
+                    #  cases where clause "IF NOT EXISTS" is not implemented.
+               elif self.layout( table ) is None:
+                    with self.session() as s:
+                         s.proceed( ' '.join( [a, b, 'notes TEXT)'] ) )
+                         s.splitrig( table )
           except IOError:
                if DEBUG:
                     print " :: createtable: table exists."
+          self.known.pop( ( self.db, table ), None )
           #    createtable is designed to be harmless if it 
           #    left sitting in your script.
 
+     INDEXABLE = ( 'notes', 'tunix' )
+     #  Columns which ensureindex will index, as index t_<column>.
+
+     def ensureindex( self, column='notes', table=tab0 ):
+          '''Index column (notes or tunix) of table unless already done.'''
+          #  notes: anchored comma terms like 'report-2026*' (wild=False)
+          #         become a range of the index instead of a scan,
+          #         see Util.commaplan and Util.explaincomma.
+          #  tunix: time ranges, see Subquery.rangesub which calls this
+          #         on demand.
+          if column not in self.INDEXABLE:
+               raise ValueError, " !! ensureindex: no index for %s." % column
+          d = { 't' : table, 'c' : column }
+          self.proceed( 'CREATE INDEX IF NOT EXISTS %(t)s_%(c)s ON %(t)s (%(c)s)' % d )
+          self.known.pop( ( self.db, table ), None )
+          #  Each index costs some insert speed and disk space.
+
+     def splitrig( self, table=tab0 ):
+          '''Rig companion t_pz, its view t_obj and triggers for split table.'''
+          #  Inserts go into the view t_obj, whose INSTEAD OF trigger puts
+          #  the row into the narrow table and its pzblob into t_pz.
+          #  Deletes go against the narrow table, whose trigger also
+          #  deletes the companion blob.  Reads of objects use the view.
+          self.claim( table, 'pz' )
+          self.claim( table, 'obj' )
+          d = { 't' : table }
+          for sql in [
+          'CREATE TABLE IF NOT EXISTS %(t)s_pz (kid INTEGER PRIMARY KEY, pzblob BLOB)',
+          '''CREATE TRIGGER IF NOT EXISTS %(t)s_pz_del AFTER DELETE ON %(t)s
+               BEGIN DELETE FROM %(t)s_pz WHERE kid = OLD.kid; END''',
+          '''CREATE VIEW IF NOT EXISTS %(t)s_obj AS
+               SELECT %(t)s.kid AS kid, tunix, notes, pzblob
+               FROM %(t)s LEFT JOIN %(t)s_pz ON %(t)s_pz.kid = %(t)s.kid''',
+          #              ^LEFT so that the narrow table is always scanned first.
+          '''CREATE TRIGGER IF NOT EXISTS %(t)s_obj_ins INSTEAD OF INSERT ON %(t)s_obj
+               BEGIN
+               INSERT INTO %(t)s (kid, tunix, notes)
+                    VALUES (NEW.kid, NEW.tunix, NEW.notes);
+               INSERT INTO %(t)s_pz (kid, pzblob)
+                    VALUES (last_insert_rowid(), NEW.pzblob);
+               END''' ]:
+               self.proceed( sql % d )
+
+     def ttltable( self, table=tab0 ):
+          '''Add expiry column texp to table, its index t_exp, and view t_live.'''
+          #  texp is the unix time (REAL) at which a row expires; NULL for 
+          #  never.  Reads of objects go through the view t_live, which 
+          #  leaves out expired rows found by the partial index t_exp -- 
+          #  no table scan, and never a look at texp past the pzblob.
+          #  Expired rows stay on disk until Deletion.expire (or a Reaper).
+          with self.session() as s:
+               layout = s.fresh( table )
+               if layout['ttl']:
+                    return
+               d = { 't' : table }
+               for sql in [
+               'ALTER TABLE %(t)s ADD COLUMN texp REAL',
+               '''CREATE INDEX IF NOT EXISTS %(t)s_exp ON %(t)s (texp)
+                    WHERE texp IS NOT NULL''' ]:
+                    s.proceed( sql % d )
+               s.liverig( table, layout['split'] )
+          self.known.pop( ( self.db, table ), None )
+
+     def liverig( self, table=tab0, split=False ):
+          '''Rig view t_live: objects of table, less rows expired by texp.'''
+          self.claim( table, 'live' )
+          d = { 't' : table, 'source' : split and table + '_obj' or table }
+          self.proceed( '''CREATE VIEW IF NOT EXISTS %(t)s_live AS
+               SELECT kid, tunix, notes, pzblob FROM %(source)s
+               WHERE kid NOT IN (SELECT kid FROM %(t)s
+                    WHERE texp <= ( julianday('now') - 2440587.5 ) * 86400.0)''' % d )
+               #  ^the current unix time with fractions, like time.time()
+
+     def caprig( self, table=tab0, split=False ):
+          '''Rig t_cap holding caps and running blob bytes, kept by triggers.'''
+          self.claim( table, 'cap' )
+          d = { 't' : table, 'blobs' : split and table + '_pz' or table }
+          #                  ^the table which holds pzblob in either layout.
+          for sql in [
+          '''CREATE TABLE IF NOT EXISTS %(t)s_cap
+               (maxrows INTEGER, maxbytes INTEGER, bytes INTEGER)''',
+          '''INSERT INTO %(t)s_cap (maxrows, maxbytes, bytes)
+               SELECT NULL, NULL, 0 WHERE NOT EXISTS (SELECT * FROM %(t)s_cap)''',
+          '''UPDATE %(t)s_cap SET bytes =
+               (SELECT COALESCE( SUM( LENGTH( pzblob ) ), 0 ) FROM %(blobs)s)''',
+          #  ^recounted, so that it may be rigged again (see splittable),
+          #   keeping the caps.
+          '''CREATE TRIGGER IF NOT EXISTS %(t)s_cap_ins AFTER INSERT ON %(blobs)s
+               BEGIN UPDATE %(t)s_cap SET bytes = bytes + LENGTH( NEW.pzblob ); END''',
+          '''CREATE TRIGGER IF NOT EXISTS %(t)s_cap_del AFTER DELETE ON %(blobs)s
+               BEGIN UPDATE %(t)s_cap SET bytes = bytes - LENGTH( OLD.pzblob ); END''' ]:
+               self.proceed( sql % d )
+          #  A running total, so that the byte budget is checked without
+          #  adding up every blob after each insert.
+
+     def evict( self, table=tab0 ):
+          '''Within a session: delete oldest rows over the caps in t_cap; count.'''
+          a = 'SELECT maxrows, maxbytes, bytes FROM %s_cap' % table
+          maxrows, maxbytes, nbytes = self.con.execute( a ).fetchone()
+          evicted = 0
+          cutoff  = None
+          if maxrows is not None:
+               a = 'SELECT kid FROM %s ORDER BY kid DESC LIMIT 1 OFFSET ?'
+               got = self.con.execute( a % table, [ maxrows ] ).fetchone()
+               #  ^the newest kid which no longer fits, if any.
+               if got:
+                    cutoff = got[0]
+          if maxbytes is not None and nbytes > maxbytes:
+               layout = self.layout( table )
+               blobs  = layout['split'] and table + '_pz' or table
+               a = 'SELECT kid, LENGTH( pzblob ) FROM %s ORDER BY kid'
+               excess = nbytes - maxbytes
+               for kid, size in self.con.execute( a % blobs ):
+                    if excess <= 0:
+                         break
+                    excess -= size
+                    cutoff = max( cutoff, kid )
+               #  LENGTH of a blob comes from the record header:
+               #  the blob itself is never read.
+          if cutoff is not None:
+               self.proceed( 'DELETE FROM %s WHERE kid <= ?' % table, [[ cutoff ]] )
+               evicted = self.con.execute( 'SELECT changes()' ).fetchone()[0]
+          return evicted
+          #  Oldest first, by kid: the work done is in proportion to the 
+          #  rows evicted, which in steady state is the rows inserted.
+
+
+     #       __________ SCHEMA cache of tables known to exist
+
+     known = {}
+     #  Per-process cache shared by all instances:  (db, table) -> layout,
+     #  a dictionary describing the table (see inspect), which includes the
+     #  schema version at the time the table was inspected.
+     #  Invalidated by createtable and droptable, and by fresh whenever the
+     #  schema version has moved on, e.g. because another process dropped
+     #  or split the table (or merely created another one).
+
+     def schema( self ):
+          '''Get the schema version of the database, see PRAGMA.'''
+          con = None
+          try:
+               con = self.connect()
+               version = con.execute( 'PRAGMA schema_version' ).fetchone()[0]
+          except:
+               if con is not None:
+                    self.release( con, broken=True )
+               raise IOError, " !! Base.schema: cannot read %s" % self.db
+          self.release( con )
+          return version
+          #  The version increments with every CREATE, DROP or ALTER.
+
+     COMPANIONS = {
+          'tag' : '(tag TEXT, kid INTEGER)',
+          'tri' : "USING fts5( notes, content='%(t)s', content_rowid='kid', tokenize=",
+          'fts' : "USING fts5( notes, content='%(t)s', content_rowid='kid', prefix=",
+          'dead': 'pzblob BLOB, qkid INTEGER, tries INTEGER, tdead REAL',
+          'live': '(SELECT kid FROM %(t)s WHERE texp <=',
+          'cap' : '(maxrows INTEGER, maxbytes INTEGER, bytes INTEGER)',
+          'pz'  : '(kid INTEGER PRIMARY KEY, pzblob BLOB)',
+          'obj' : 'FROM %(t)s LEFT JOIN %(t)s_pz ON' }
+     #  Mark of each companion t_<suffix> within its sqlite_master.sql, as
+     #  rigged by this module.  A name alone proves nothing: a user's own
+     #  table orders_dead is neither the dead letters of orders, nor to be
+     #  dropped along with orders.
+
+     def ours( self, sql, table, suffix ):
+          '''Whether sql (from sqlite_master) is that of companion t_suffix.'''
+          mark = self.COMPANIONS[ suffix ] % { 't' : table }
+          return ' '.join( mark.split() ) in ' '.join( ( sql or '' ).split() )
+          #                   ^whitespace as written does not matter.
+
+     def claim( self, table, suffix ):
+          '''Raise IOError if name t_suffix is taken, but not by a companion.'''
+          a = 'SELECT sql FROM sqlite_master WHERE name = ?'
+          for row in self.rows( a, [ '%s_%s' % ( table, suffix ) ] ):
+               if not self.ours( row[0], table, suffix ):
+                    b = " !! %s_%s exists, but not as a companion of %s."
+                    raise IOError, b % ( table, suffix, table )
+          #  Rigs call this before CREATE ... IF NOT EXISTS, which would
+          #  otherwise pass over the foreign table and write into it.
+
+     def inspect( self, table=tab0 ):
+          '''Describe table and companions from sqlite_master; None if absent.'''
+          con = None
+          try:
+               con = self.connect()
+               version = con.execute( 'PRAGMA schema_version' ).fetchone()[0]
+               sql = '''SELECT name, type, tbl_name, sql FROM sqlite_master
+                         WHERE name = ? OR name GLOB ?'''
+               found = con.execute( sql, [table, table+'_*'] ).fetchall()
+          except:
+               if con is not None:
+                    self.release( con, broken=True )
+               raise IOError, " !! Base.inspect: cannot read %s" % self.db
+          self.release( con )
+          sqls = dict( [ ( name, sql ) for name, kind, tbl, sql in found ] )
+          if table not in sqls:
+               return None
+          indexes = [ name for name, kind, tbl, sql in found
+                           if kind == 'index' and tbl == table ]
+          def has( suffix ):
+               name = '%s_%s' % ( table, suffix )
+               return name in sqls and self.ours( sqls[name], table, suffix )
+          layout = { 'version' : version, 'source' : table, 'split' : False,
+                     'tags'    : has( 'tag' ),
+                     'trigrams': has( 'tri' ),
+                     'fts'     : has( 'fts' ),
+                     'queue'   : has( 'dead' ),
+                     'ttl'     : has( 'live' ),
+                     'cap'     : has( 'cap' ),
+                     'indexed' : [ c for c in self.INDEXABLE
+                                     if '%s_%s' % ( table, c ) in indexes ] }
+          #  ^companions by their shape (see COMPANIONS), never by name
+          #   alone, so droptable only ever drops what this module made.
+          if has( 'obj' ) and has( 'pz' ):
+               layout['source'] = table + '_obj'
+               layout['split']  = True
+          layout['target'] = layout['source']
+          #  ^where inserts go; reads of objects come from source.
+          if layout['ttl']:
+               layout['source'] = table + '_live'
+          return layout
+
+     def layout( self, table=tab0 ):
+          '''Get cached description of table, inspecting it once.'''
+          key = ( self.db, table )
+          if key not in self.known:
+               layout = self.inspect( table )
+               if layout is None:
+                    return None
+               self.known[key] = layout
+          return self.known[key]
+
+     def source( self, table=tab0 ):
+          '''Name to select objects (kid, tunix, notes, pzblob) from.'''
+          layout = self.layout( table )
+          if layout is None:
+               return table
+          return layout['source']
+
+     def target( self, table=tab0 ):
+          '''Name to insert objects (kid, tunix, notes, pzblob) into.'''
+          layout = self.layout( table )
+          if layout is None:
+               return table
+          return layout['target']
+
+     def visible( self, table=tab0 ):
+          '''Name to select metadata (kid, tunix, notes) of unexpired rows.'''
+          layout = self.layout( table )
+          if layout is None or not layout['ttl']:
+               return table
+          return layout['source']
+
+     def current( self, table=tab0 ):
+          '''Get layout of table as of schema now; None if it is absent.'''
+          layout = self.layout( table )
+          if layout is not None and layout['version'] != self.schema():
+               self.known.pop( ( self.db, table ), None )
+               layout = self.layout( table )
+          return layout
+          #  (layout is not cached for an absent table, so None is news.)
+
+     def fresh( self, table=tab0 ):
+          '''Get layout of table, created if need be, as of schema now.'''
+          layout = self.current( table )
+          if layout is None:
+               self.createtable( table )
+               layout = self.layout( table )
+          return layout
+
+
+
+import copy as yCopy
+
+class Session:
+     '''_______________ Group many operations into a single transaction.'''
+     #  Each method of Main is normally its own transaction, hence its own
+     #  commit and fsync.  Within a session, they all share one connection
+     #  and one transaction which commits once at exit:
+     #
+     #       with I.session() as s:
+     #            s.insert( obj, '#plan agent007', 'goldfinger' )
+     #            s.deletekid( 3, 'goldfinger' )
+     #            obj2 = s.fifo( 'goldfinger' )
+     #       #    ^COMMIT here, or ROLLBACK if an exception was raised.
+     #
+     #  s is a shallow copy of the instance I, bound to the connection.
+     #  The transaction begins IMMEDIATE, i.e. holds the write lock
+     #  throughout, so keep sessions short and do not use other instances
+     #  on the same database inside (they would wait up to TIMEOUT).
+     #  VACUUM cannot run inside a transaction, hence not in a session.
+     #  Sessions nest: a session of s simply returns s itself.
+
+     def __init__( self, host ):
+          '''Remember the instance whose database shall be used.'''
+          self.host  = host
+          self.clone = None
+
+     def __enter__( self ):
+          '''Check out a connection and BEGIN; return the bound instance.'''
+          if self.host.con is not None:
+               return self.host
+          con = self.host.connect()
+          try:
+               con.isolation_level = None
+               #  ^sqlite3 module must not commit implicitly, e.g. before
+               #   CREATE TABLE, so we BEGIN and COMMIT ourselves.
+               con.execute( 'BEGIN %s' % ( self.host.TRANSACT or 'IMMEDIATE' ) )
+          except:
+               self.host.release( con, broken=True )
+               a = " !! Session could not BEGIN. [Check db path.] \n"
+               b = "             Suspect busy after TIMEOUT.      \n"
+               raise IOError, "%s%s" % ( a, b )
+          self.clone = yCopy.copy( self.host )
+          self.clone.con = con
+          self.changes = con.total_changes
+          return self.clone
+
+     def __exit__( self, kind, value, trace ):
+          '''COMMIT, or ROLLBACK on exception; release the connection.'''
+          if self.clone is None:
+               return False
+          clone, self.clone = self.clone, None
+          con, clone.con = clone.con, None
+          try:
+               if kind is None:
+                    con.execute( 'COMMIT' )
+                    if con.total_changes != self.changes:
+                         bell.ring()
+                    #  ^not for a session which wrote nothing, e.g. an
+                    #   attempt of block on an empty queue.
+               else:
+                    con.execute( 'ROLLBACK' )
+                    self.forget()
+          except:
+               self.host.release( con, broken=True )
+               #  ^closing rolls back whatever was left uncommitted.
+               self.forget()
+               if kind is None:
+                    raise IOError, " !! Session did not COMMIT."
+               return False
+          con.isolation_level = self.host.TRANSACT
+          self.host.release( con )
+          return False
+          #      ^exception, if any, propagates to the caller.
+
+     def forget( self ):
+          '''Drop cached layouts of the database: schema changes rolled back.'''
+          for key in self.host.known.keys():
+               if key[0] == self.host.db:
+                    self.host.known.pop( key, None )
+          #  Tables, views and columns created in the session are gone,
+          #  yet layouts inspected meanwhile would still claim them.
+
 
 
-class Insertion( Base ):
+class Util:
+     '''_______________ Utility methods for keys, subquery, comma'''
+     #  Mixed into classes derived from Base: commasub consults the layout.
+
+     def reverse_dickeys( self, dictionary, recentfirst=True ):
+          '''List dictionary keys: sorted reverse (chronological) order.'''
+          dickeys = dictionary.keys()
+          dickeys.sort()
+          if recentfirst:
+               dickeys.reverse()
+          return dickeys
+
+
+     #           _____ SUBQUERY regex style for LIKE  
+     #
+     #  Here we want the dictionary to consist of items which have
+     #  notes containing " gold " (using LIKE):
+     #
+     #             dic = I.dicsub("WHERE notes LIKE '% gold %'")
+     #
+     #  Percent    % in LIKE is the regex equivalent of star      "*"
+     #             ^wildcard for 0 or more characters
+     #  Underscore _ in LIKE is the regex equivalent of period    "."
+     #             ^single character
+     #  Escape     ! in LIKE is the regex equivalent of backslash "\"
+     #                  (or one can specify an escape character 
+     #                   by appending, for example, "ESCAPE '\'"
+     #                   at the end of the subquery.)
+     #  [a-c]   same in LIKE for character ranges, exclude by     "^"
+
+     #           _____ SUBQUERY regex style for GLOB 
+     #
+     #  For SQLite: the GLOB operator is similar to LIKE but uses the 
+     #  Unix file globbing [dissimilar to grep] syntax for its wildcards. 
+     #             ? in GLOB is the regex equivalent of period    "."
+     # 
+     #                  GLOB is case sensitive, unlike LIKE.            <= 
+     #  But LIKE is case sensitive for unicode characters beyond ASCII.
+     #  Both GLOB and LIKE may be preceded by the NOT keyword 
+     #  to invert the sense of the test.
+
+     def lastsub( self, m, table ):
+          '''Subquery and parameter list for the last m kids in table.'''
+          a = 'WHERE kid IN (SELECT kid FROM %s ORDER BY kid DESC LIMIT ?)'
+          return ( a % self.visible( table ), [ m ] )
+          #  Walks back m entries of the key index -- unlike lastkid - m,
+          #  this does not presume consecutive kids (deletion leaves gaps).
+          #  Counts unexpired rows only, should table have a ttl.
+
+     def notesglob( self, parlist ):
+          '''Create a CONJUNCTIVE subquery using GLOB with placeholder.'''
+          #           ^i.e. each term in parlist is an "AND" search term.
+          s = ""
+          for i in parlist:
+               s += "AND notes GLOB ? "
+               #    use placeholder ^ rather than i for security!
+          return s.replace('AND', 'WHERE', 1)
+          #        replace only the first occurrence
+
+
+     #  Everyone is going to have a unique style of writing out their notes 
+     #  so that it can be efficiently searched. Tags are helpful, but they 
+     #  are optional within notes. Tags are useful for creating indexes.
+     #       Define a "TAG" to be text in notes prefixed by "#" 
+
+     def comma2list( self, csvstr, wild=True ):
+          '''Convert comma separated values within string to a parameter list 
+               >>> #     !! white spaces within string are significant !! 
+               >>> print comma2list('#paris, agent007 ,#scheme')
+               ['*#paris*', '* agent007 *', '*#scheme*']
+
+             Empty or single entry (without comma) csvstr is acceptable.
+             Empty string '' will select everything if wild is True.
+             Unlike official csv, internal quotes should not be used;
+             for simplicity, comma itself is not meant to be escaped.
+          '''
+          #  wild will conveniently include stars on both ends...
+          if wild:
+               parlist = [ '*%s*' % i for i in csvstr.split(',') ]
+          else:
+               parlist = [  '%s'  % i for i in csvstr.split(',') ]
+               #  manually add wildcards as needed to csvstr for faster regex.
+          return parlist 
+          #
+          #  TIP: use wild=False for exact search wherever possible.
+          #       (commasub puts the most discriminating values first,
+          #        as sampled, so the order within csvstr matters little.)
+          #
+          #       To form csvstr out of string variables a, b, c:
+          #               csvstr = ','.join( [a, b, c] )
+          #       See function comma after Main class.
+
+     def andsub( self, subquery ):
+          '''Turn a plain "WHERE ..." subquery into "AND ( ... )", else None.'''
+          words = subquery.split()
+          if not words:
+               return ''
+          if words[0].upper() != 'WHERE':
+               return None
+          for word in words:
+               if word.upper() in ( 'ORDER', 'LIMIT', 'GROUP' ):
+                    return None
+          #  ^subqueries which pick rows by position cannot be windowed.
+          return 'AND ( %s )' % subquery.strip()[5:]
+
+     def commasub( self, csvstr, table=Base.tab0, wild=True ):
+          '''Subquery and parameter list: notes match comma separated values.'''
+          subquery, parlist, paths = self.commaplan( csvstr, table, wild )
+          return ( subquery, parlist )
+
+     def commaplan( self, csvstr, table=Base.tab0, wild=True ):
+          '''Subquery, parameter list, and the path taken for each term.'''
+          parlist  = self.comma2list( csvstr, wild )
+          layout = self.layout( table )
+          if layout is None:
+               paths = [ 'scan' ] * len( parlist )
+               return ( self.notesglob( parlist ), parlist, paths )
+          terms = zip( csvstr.split(','), parlist )
+          if len( terms ) > 1 and self.SAMPLE:
+               counts = dict( zip( parlist, self.sample( parlist, table ) ) )
+               terms.sort( key=lambda term: counts[ term[1] ] )
+               #  SQLite tests the GLOBs of the AND chain in order,
+               #  so the rarest match goes first (sort is stable).
+          parlist  = [ pattern for term, pattern in terms ]
+          narrows, narrowpars, runs = [], [], []
+          ranges, rangepars, paths  = [], [], []
+          for term, pattern in terms:
+               body   = term.strip('*').strip()
+               prefix = self.globprefix( pattern )
+               if layout['tags'] and self.istag( body ):
+                    lo, hi = self.prefixrange( body )
+                    a = 'SELECT kid FROM %s_tag WHERE tag >= ?' % table
+                    if hi is None:
+                         narrows.append( a )
+                         narrowpars.append( lo )
+                    else:
+                         narrows.append( a + ' AND tag < ?' )
+                         narrowpars.extend( [ lo, hi ] )
+                    paths.append( 'tag' )
+               elif 'notes' in layout['indexed'] and prefix:
+                    lo, hi = self.prefixrange( prefix )
+                    ranges.append( 'notes >= ?' )
+                    rangepars.append( lo )
+                    if hi is not None:
+                         ranges.append( 'notes < ?' )
+                         rangepars.append( hi )
+                    paths.append( 'prefix' )
+                    #  anchored, e.g. 'report-2026*' (wild=False), which
+                    #  is a range of the notes index.
+               elif layout['trigrams']:
+                    found = [ r for r in self.globruns( pattern )
+                                if self.charlen( r ) >= 3 ]
+                    #  shorter runs have no trigram, so they must scan.
+                    runs.extend( found )
+                    paths.append( found and 'trigram' or 'scan' )
+               else:
+                    paths.append( 'scan' )
+          if runs:
+               a = 'SELECT rowid FROM %s_tri WHERE %s_tri MATCH ?'
+               narrows.append( a % ( table, table ) )
+               narrowpars.append( ' AND '.join([ '"%s"' % r.replace('"', '""')
+                                                 for r in runs ]) )
+          conds = ranges + [ 'notes GLOB ?' ] * len( parlist )
+          #                           use placeholder ^ for security!
+          if narrows:
+               conds.insert( 0, 'kid IN (%s)' % ' INTERSECT '.join( narrows ) )
+          subquery = 'WHERE %s ' % ' AND '.join( conds )
+          return ( subquery, narrowpars + rangepars + parlist, paths )
+          #  The indexes only narrow the candidate kids; the GLOB terms
+          #  still decide, so results are exactly those without indexes.
+          #  Any note matching '*#paris*' has some tag beginning "#paris",
+          #  hence a tag term with or without stars may use the tag index.
+          #  Likewise any note matching 'agent00[1-7]*' contains "agent00",
+          #  which the trigram index finds as a substring; and it begins
+          #  with "agent00", hence lies in that range of the notes index.
+
+     def globprefix( self, pattern ):
+          '''Literal prefix of a GLOB pattern, before any wildcard.'''
+          for i, c in enumerate( pattern ):
+               if c in '*?[':
+                    return pattern[:i]
+          return pattern
+
+     def explaincomma( self, csvstr, table=Base.tab0, wild=True ):
+          '''Paths taken per term, and SQLite's EXPLAIN QUERY PLAN details.'''
+          #  e.g.  ( ['prefix', 'scan'],
+          #          [u'SEARCH ytest USING INDEX ytest_notes (notes>? AND notes<?)'] )
+          subquery, parlist, paths = self.commaplan( csvstr, table, wild )
+          sql = 'EXPLAIN QUERY PLAN SELECT kid FROM %s %s' % ( table, subquery )
+          plan = [ row[-1] for row in self.rows( sql, parlist ) ]
+          return ( paths, plan )
+
+
+     SAMPLE   = 1000
+     #  Latest rows sampled to estimate how many notes each comma term
+     #  matches; 0 keeps the order of terms as given in csvstr.
+     STATSAGE = 600
+     #  Seconds until a sampled count is sampled again.
+
+     selectivity = {}
+     #  Per-process cache shared by all instances:
+     #  (db, table, pattern) -> ( matches within sample, unix time ).
+
+     def sample( self, patterns, table=Base.tab0 ):
+          '''Count matches of each GLOB pattern among latest SAMPLE notes.'''
+          now  = time.time()
+          todo = []
+          for p in patterns:
+               stat = self.selectivity.get( ( self.db, table, p ) )
+               if stat is None or now - stat[1] > self.STATSAGE:
+                    todo.append( p )
+          if todo:
+               a = ', '.join([ 'TOTAL( notes GLOB ? )' ] * len( todo ))
+               b = 'FROM (SELECT notes FROM %s ORDER BY kid DESC LIMIT ?)'
+               sql = ' '.join([ 'SELECT', a, b % table ])
+               #     ^one pass over the sample for all new patterns.
+               counts = self.rows( sql, todo + [ self.SAMPLE ] )[0]
+               if len( self.selectivity ) > 10000:
+                    self.selectivity.clear()
+                    #  ^crude bound on memory for ad hoc patterns.
+               for p, n in zip( todo, counts ):
+                    self.selectivity[ ( self.db, table, p ) ] = ( n, now )
+          return [ self.selectivity[ ( self.db, table, p ) ][0] for p in patterns ]
+          #  Sampling the latest rows walks back the key index only, and
+          #  costs about one scan of SAMPLE notes per new set of terms.
+
+
+     #           _____ TRIGRAMS of notes, optionally indexed (see Care.triindex)
+
+     def globruns( self, pattern ):
+          '''List the literal runs of a GLOB pattern, between its wildcards.'''
+          runs, run, i = [], '', 0
+          while i < len( pattern ):
+               c = pattern[i]
+               if c in '*?[':
+                    runs.append( run )
+                    run = ''
+                    if c == '[':
+                         #  skip the character class; a "]" right after
+                         #  "[" or "[^" belongs to the class.
+                         start = i + 1
+                         if pattern[start:start+1] == '^':
+                              start += 1
+                         i = pattern.find( ']', start + 1 )
+                         if i < 0:
+                              break
+               else:
+                    run += c
+               i += 1
+          else:
+               runs.append( run )
+          return [ r for r in runs if r ]
+
+     def charlen( self, text ):
+          '''Count characters rather than bytes of (UTF-8) text.'''
+          if isinstance( text, unicode ):
+               return len( text )
+          try:
+               return len( text.decode('utf-8') )
+          except UnicodeDecodeError:
+               return 0
+          #  The trigram tokenizer counts characters; a phrase of fewer
+          #  than three would match nothing, so 0 keeps such text out.
+
+     def ftsquery( self, csvstr ):
+          '''Convert comma separated words to an FTS5 query, all required.
+               >>> print ftsquery('agent007, paris ,plan*')
+               "agent007" AND "paris" AND "plan" *
+          '''
+          terms = []
+          for i in csvstr.split(','):
+               term = i.strip()
+               if term.endswith('*'):
+                    term = '"%s" *' % term.rstrip('*').replace('"', '""')
+                    #                ^prefix query
+               elif term:
+                    term = '"%s"' % term.replace('"', '""')
+               if term:
+                    terms.append( term )
+          return ' AND '.join( terms )
+          #  Each term is quoted, so FTS5 operators in csvstr are inert;
+          #  use ftssub directly for the full query syntax.
+
+
+     #           _____ TAGS in notes, optionally indexed (see Care.tagindex)
+     #
+     #  Tags are whitespace delimited, and one word may carry several:
+     #  "#plan agent007#london#paris" has tags #plan, #london, #paris.
+
+     def tagsof( self, notes ):
+          '''List distinct tags (each prefixed by "#") found in notes.'''
+          tags = []
+          for word in ( notes or '' ).split():
+               for piece in word.split('#')[1:]:
+                    if piece and ( '#' + piece ) not in tags:
+                         tags.append( '#' + piece )
+          return tags
+
+     def istag( self, term ):
+          '''Is the search term a plain tag, i.e. fit for the tag index?'''
+          if len( term ) < 2 or term[0] != '#' or '#' in term[1:]:
+               return False
+          for c in '*?[':
+               if c in term:
+                    return False
+          return len( term.split() ) == 1
+
+     def prefixrange( self, prefix ):
+          '''Bounds (lo, hi) such that lo <= text < hi iff text starts with prefix.'''
+          last = ord( prefix[-1] )
+          try:
+               if isinstance( prefix, unicode ):
+                    hi = prefix[:-1] + unichr( last + 1 )
+               elif last < 0x7f:
+                    hi = prefix[:-1] + chr( last + 1 )
+               else:
+                    hi = None
+          except ValueError:
+               hi = None
+          return ( prefix, hi )
+          #  hi is None at the edge of the character set (or for non-ASCII
+          #  bytes), where only the lower bound can be used.
+
+
+
+
+class Insertion( Base, Util ):
      '''_______________ INSERT pz BLOB into DATABASE'''
 
      #  For inbatch we shall assume that the "objseq" is a sequence  
@@ -620,45 +1910,116 @@ class Insertion( Base ):
      #       objseq = [ (obj1, 'First thing'), (obj2, 'Second thing') ]
      #  Use an empty string like "" to explicitly blank out annotation.
 
-     def inbatch( self, objseq, table=Base.tab0 ):
+     def inbatch( self, objseq, table=Base.tab0, ttl=None ):
           '''Pickle and compress sequence of annotated objects; insert.'''
-          self.createtable( table ) 
-          #    ^ serves also to check table's existence.
-          s  = "INSERT INTO %s " % table
-          v  = "VALUES (null, strftime('%s','now'), ?, ?)"
-          #                   ^SQLite's function for unix epoch time.
-          sql = ' '.join([s, v])
-          def generate_parlist():
+          def generate_pzrows():
                for i in objseq:
                     obj, notes = i
-                    parlist  = [ notes, ysql.Binary(pzdumps(obj)) ]
-                    yield parlist
+                    pzrow  = [ notes, ysql.Binary(pzdumps(obj)) ]
+                    yield pzrow
                     #     ^ using generator for parameter list.
-          self.proceed( sql, generate_parlist() ) 
+          self.inpz( generate_pzrows(), table, ttl )
           #    inserting 100,000 rows takes about 10 seconds.
 
+     def inpz( self, pzrows, table=Base.tab0, ttl=None ):
+          '''Insert rows [notes, pzblob] in one transaction; get kid range.'''
+          #  ttl: seconds until the rows expire (see Base.ttltable).
+          with self.session() as s:
+               if ttl is not None:
+                    s.ttltable( table )
+               layout = s.fresh( table )
+               #    ^ serves also to check table's existence, but creates
+               #      it only once per process.  Under the write lock, the
+               #      schema version tells whether another process has
+               #      dropped or altered the table since we looked.
+               maxkid = 'SELECT MAX( kid ) FROM %s' % table
+               kid0 = s.con.execute( maxkid ).fetchone()[0] or 0
+               if layout['tags']:
+                    noted = []
+                    def generate_noted():
+                         for pzrow in pzrows:
+                              noted.append( pzrow[0] )
+                              yield pzrow
+                    s.proceed( s.insertsql( table ), generate_noted() )
+                    s.sideindex( table, kid0 + 1, noted )
+               else:
+                    s.proceed( s.insertsql( table ), pzrows )
+               kid1 = s.con.execute( maxkid ).fetchone()[0] or 0
+               if ttl is not None and kid1 > kid0:
+                    a = 'UPDATE %s SET texp = ? WHERE kid BETWEEN ? AND ?'
+                    s.proceed( a % table, [[ time.time() + ttl, kid0 + 1, kid1 ]] )
+                    #  same transaction: no row is ever seen without expiry.
+               if layout['cap']:
+                    s.evict( table )
+                    #  same transaction: the table never exceeds its caps.
+          return ( kid0 + 1, kid1 )
+          #  The session holds the write lock, so our kids are consecutive.
+
+     def insertsql( self, table=Base.tab0 ):
+          '''SQL to insert a row [notes, pzblob] into table, either layout.'''
+          s  = "INSERT INTO %s (kid, tunix, notes, pzblob)" % self.target( table )
+          v  = "VALUES (null, strftime('%s','now'), ?, ?)"
+          #                   ^SQLite's function for unix epoch time.
+          return ' '.join([s, v])
+
+     def sideindex( self, table, kid, notelist ):
+          '''Record tags of notes in notelist for rows kid, kid+1, ...'''
+          def generate_tagrows():
+               for i, notes in enumerate( notelist ):
+                    for tag in self.tagsof( notes ):
+                         yield [ tag, kid + i ]
+          sql = 'INSERT OR IGNORE INTO %s_tag (tag, kid) VALUES (?, ?)' % table
+          self.proceed( sql, generate_tagrows() )
+
      #  objseq can be generated on the fly. Just write a generator function, 
-     #  and pass it along to pzgenerator [for illustration, see copy].
+     #  and pass it along to ingenerator [for illustration, see copy].
+
+     CHUNK      = 1000
+     CHUNKBYTES = 8 * 1024 * 1024
+     #  ingenerator commits after every CHUNK rows, or as soon as the
+     #  pending compressed blobs amount to CHUNKBYTES, whichever is first.
+     #  So memory stays flat however long the generator runs.
 
-     def ingenerator( self, generate_objnotes, table=Base.tab0 ):
-          '''Pickle and compress via generator function, then insert.'''
+     def ingenerator( self, generate_objnotes, table=Base.tab0,
+                            chunk=None, chunkbytes=None, ttl=None ):
+          '''Pickle and compress via generator, insert chunk by chunk.'''
           #  generator should yield an objseq element like this: (obj, notes)
-          self.inbatch( [x for x in generate_objnotes], table )
+          #  Returns ( rows written, first kid, last kid ); the kid range
+          #  may also span rows which others inserted between our chunks.
+          chunk      = chunk      or self.CHUNK
+          chunkbytes = chunkbytes or self.CHUNKBYTES
+          rows, kidmin, kidmax = 0, None, None
+          pzrows, size = [], 0
+          for obj, notes in generate_objnotes:
+               pzob = pzdumps( obj )
+               pzrows.append([ notes, ysql.Binary(pzob) ])
+               size += len( pzob )
+               if len( pzrows ) >= chunk or size >= chunkbytes:
+                    kid0, kidmax = self.inpz( pzrows, table, ttl )
+                    rows  += len( pzrows )
+                    kidmin = kidmin or kid0
+                    pzrows, size = [], 0
+          if pzrows:
+               kid0, kidmax = self.inpz( pzrows, table, ttl )
+               rows  += len( pzrows )
+               kidmin = kidmin or kid0
+          return ( rows, kidmin, kidmax )
 
           #  TIP:  generate computationally intense results, then 
           #  pass them to ingenerator which will warehouse them. Instantly 
           #  access those pre-computed results later by subquery on notes.
 
-
-     def insert( self, obj, notes='#0notes', table=Base.tab0 ):
+     def insert( self, obj, notes='#0notes', table=Base.tab0, ttl=None ):
           '''Pickle and compress single object; insert with annotation.'''
-          self.inbatch( [(obj, notes)], table )
+          self.inbatch( [(obj, notes)], table, ttl )
+          #  ttl: seconds until the object expires; None for never.
 
           #  CAVEAT: if you have *lots* of objects to insert individually 
           #  this repeatedly will be slow because it commits after every 
           #  insert which causes sqlite to sync the inserted data to disk. 
           #       REMEDY: prepare your annotated objects in objseq form, 
           #       then use inbatch or ingenerator instead.  
+          #       Or insert within a session, which commits once at exit.
 
 
 
@@ -730,6 +2091,12 @@ class Answer( Base ):
                #  (same as in the table), and it is a list consisting of  <= 
                #       timestamp, notes, and original object              <= 
                #                         (decompressed and unpickled).    <= 
+          if klass == 'Notes':
+               kid, tunix, notes  =  tupler
+               response[kid] = [ tunix, notes ]
+               #  metadata only: pzblob is neither read nor decoded.
+          if klass == 'Kids':
+               response[ tupler[0] ] = None
 
      def shout( self, question, table=Base.tab0 ):
           '''Shout a question; get a short answer.'''
@@ -772,99 +2139,71 @@ class Answer( Base ):
 
 
 
-class Util:
-     '''_______________ Utility methods for keys, subquery, comma'''
-
-     def reverse_dickeys( self, dictionary, recentfirst=True ):
-          '''List dictionary keys: sorted reverse (chronological) order.'''
-          dickeys = dictionary.keys()
-          dickeys.sort()
-          if recentfirst:
-               dickeys.reverse()
-          return dickeys
-
-
-     #           _____ SUBQUERY regex style for LIKE  
-     #
-     #  Here we want the dictionary to consist of items which have
-     #  notes containing " gold " (using LIKE):
-     #
-     #             dic = I.dicsub("WHERE notes LIKE '% gold %'")
-     #
-     #  Percent    % in LIKE is the regex equivalent of star      "*"
-     #             ^wildcard for 0 or more characters
-     #  Underscore _ in LIKE is the regex equivalent of period    "."
-     #             ^single character
-     #  Escape     ! in LIKE is the regex equivalent of backslash "\"
-     #                  (or one can specify an escape character 
-     #                   by appending, for example, "ESCAPE '\'"
-     #                   at the end of the subquery.)
-     #  [a-c]   same in LIKE for character ranges, exclude by     "^"
-
-     #           _____ SUBQUERY regex style for GLOB 
-     #
-     #  For SQLite: the GLOB operator is similar to LIKE but uses the 
-     #  Unix file globbing [dissimilar to grep] syntax for its wildcards. 
-     #             ? in GLOB is the regex equivalent of period    "."
-     # 
-     #                  GLOB is case sensitive, unlike LIKE.            <= 
-     #  But LIKE is case sensitive for unicode characters beyond ASCII.
-     #  Both GLOB and LIKE may be preceded by the NOT keyword 
-     #  to invert the sense of the test.
-
-     def notesglob( self, parlist ):
-          '''Create a CONJUNCTIVE subquery using GLOB with placeholder.'''
-          #           ^i.e. each term in parlist is an "AND" search term.
-          s = ""
-          for i in parlist:
-               s += "AND notes GLOB ? "
-               #    use placeholder ^ rather than i for security!
-          return s.replace('AND', 'WHERE', 1)
-          #        replace only the first occurrence
-
-
-     #  Everyone is going to have a unique style of writing out their notes 
-     #  so that it can be efficiently searched. Tags are helpful, but they 
-     #  are optional within notes. Tags are useful for creating indexes.
-     #       Define a "TAG" to be text in notes prefixed by "#" 
-
-     def comma2list( self, csvstr, wild=True ):
-          '''Convert comma separated values within string to a parameter list 
-               >>> #     !! white spaces within string are significant !! 
-               >>> print comma2list('#paris, agent007 ,#scheme')
-               ['*#paris*', '* agent007 *', '*#scheme*']
-
-             Empty or single entry (without comma) csvstr is acceptable.
-             Empty string '' will select everything if wild is True.
-             Unlike official csv, internal quotes should not be used;
-             for simplicity, comma itself is not meant to be escaped.
-          '''
-          #  wild will conveniently include stars on both ends...
-          if wild:
-               parlist = [ '*%s*' % i for i in csvstr.split(',') ]
-          else:
-               parlist = [  '%s'  % i for i in csvstr.split(',') ]
-               #  manually add wildcards as needed to csvstr for faster regex.
-          return parlist 
-          #
-          #  TIP: for faster execution, list most discriminating values first;
-          #       use wild=False for exact search wherever possible.
-          #
-          #       To form csvstr out of string variables a, b, c:
-          #               csvstr = ','.join( [a, b, c] )
-          #       See function comma after Main class.
-
-
-
 class Deletion( Base, Util ):
      '''_______________ Deletion methods; also used for queue POP'''
 
+     DELCHUNK = 1000
+     #  deletechunks removes rows in windows of DELCHUNK kids by default,
+     #  each window its own transaction, so that readers and writers get 
+     #  the lock in between (see also freshen and clean with chunk).
+     DELPAUSE = 0.01
+     #  Seconds to yield between windows.
+
      def deletesub( self, subquery, parlist=[], table=Base.tab0 ):
           '''Delete row(s) matching the subquery.'''
           sql = 'DELETE FROM %s %s'  % ( table, subquery )
           #    use ? placeholder(s) for security^
           self.proceed( sql, [ parlist ] ) 
 
+     def deletechunks( self, subquery, parlist=[], table=Base.tab0,
+                       kid=0, progress=None, chunk=None ):
+          '''Delete rows matching "WHERE ..." subquery in kid windows; resumable.'''
+          cond = self.andsub( subquery )
+          if cond is None:
+               raise ValueError, " !! deletechunks: need a plain WHERE subquery."
+          chunk = max( 1, chunk or self.DELCHUNK )
+          a = 'SELECT MIN( kid ), MAX( kid ) FROM %s WHERE kid > ? %s'
+          kidmin, kidmax = self.rows( a % ( table, cond ), [ kid ] + list( parlist ) )[0]
+          #  Windows span only the kids which match as we start: rows 
+          #  inserted later are not ours to judge, and a selective 
+          #  subquery does not walk the whole table.
+          if kidmin is not None:
+               kid = max( kid, kidmin - 1 )
+          a = 'SELECT kid FROM %s WHERE kid > ? ORDER BY kid LIMIT 1 OFFSET ?'
+          b = 'DELETE FROM %s WHERE kid > ? AND kid <= ? %s' % ( table, cond )
+          deleted = 0
+          while kidmax is not None and kid < kidmax:
+               with self.session() as s:
+                    end = s.rows( a % table, [ kid, chunk - 1 ] )
+                    end = min( end[0][0], kidmax ) if end else kidmax
+                    s.proceed( b, [ [ kid, end ] + list( parlist ) ] )
+                    deleted += s.rows( 'SELECT changes()' )[0][0]
+               #  ^committed: the window is done even if we are interrupted.
+               kid = end
+               if progress is not None:
+                    progress( kid, deleted )
+               time.sleep( self.DELPAUSE )
+          return ( deleted, kid )
+          #  Each window is found by its kid bounds on the primary key,
+          #  so no window rescans what came before it.
+          #  To resume after interruption, pass back the last kid reported 
+          #  to progress (or returned): windows at or below it are done.
+          #  changes() counts main table rows only, not the side table 
+          #  rows (tag, trigram, fts) which triggers remove alongside.
+
+     REAPN = 500
+     #  expire deletes at most REAPN expired rows per transaction.
+
+     def expire( self, table=Base.tab0, n=None ):
+          '''Delete up to n (REAPN) rows whose expiry texp has passed; count.'''
+          a = '''DELETE FROM %s WHERE kid IN
+                    (SELECT kid FROM %s WHERE texp <= ? ORDER BY texp LIMIT ?)'''
+          with self.session() as s:
+               s.proceed( a % ( table, table ), [[ time.time(), n or self.REAPN ]] )
+               return s.rows( 'SELECT changes()' )[0][0]
+          #  The partial index t_exp hands over the expired rows, oldest 
+          #  expiry first, so each call touches only what it deletes.
+
      def deletekid( self, kid, table=Base.tab0 ):
           '''Delete single row with primary key kid.'''
           subquery = 'WHERE kid = ?' 
@@ -872,8 +2211,8 @@ class Deletion( Base, Util ):
 
      def deletecomma( self, csvstr, table=Base.tab0, wild=True ):
           '''Delete row(s): notes match comma separated values in string.'''
-          parlist = self.comma2list( csvstr, wild )
-          self.deletesub( self.notesglob(parlist), parlist, table )
+          subquery, parlist = self.commasub( csvstr, table, wild )
+          self.deletesub( subquery, parlist, table )
 
      def delete( self, dual, table=Base.tab0, wild=True ):
           '''Alias "delete":            deletekid OR deletecomma.'''
@@ -885,9 +2224,28 @@ class Deletion( Base, Util ):
 
      def droptable( self, table=Base.tab0 ):
           '''Delete a table: destroys its structure, indexes, data.'''
-          sql = 'DROP TABLE %s' % table 
+          sqls = [ 'DROP TABLE %s' % table ]
+          layout = self.layout( table )
+          if layout and layout['tags']:
+               sqls = sqls + [ 'DROP TABLE %s_tag' % table ]
+          if layout and layout['trigrams']:
+               sqls = [ 'DROP TABLE %s_tri' % table ] + sqls
+          if layout and layout['fts']:
+               sqls = [ 'DROP TABLE %s_fts' % table ] + sqls
+          if layout and layout['queue']:
+               sqls = sqls + [ 'DROP TABLE %s_dead' % table ]
+          if layout and layout['ttl']:
+               sqls = [ 'DROP VIEW %s_live' % table ] + sqls
+          if layout and layout['cap']:
+               sqls = sqls + [ 'DROP TABLE %s_cap' % table ]
+          if layout and layout['split']:
+               sqls = [ 'DROP VIEW %s_obj'  % table,
+                        'DROP TABLE %s_pz'  % table ] + sqls
+               #  triggers go along with the view or table they are on.
+          self.known.pop( ( self.db, table ), None )
           try:
-               self.proceed( sql ) 
+               for sql in sqls:
+                    self.proceed( sql ) 
           except:
                if DEBUG:
                     print " ?? droptable: no table to delete."
@@ -913,12 +2271,28 @@ class Subquery( Util, Answer, Deletion ):
 
      def dicsub(self, subquery='', parlist=[], table=Base.tab0, POP=False):
           '''Subquery table to get objects into response dictionary.'''
-          a = 'SELECT kid, tunix, notes, pzblob FROM %s %s'
-          sql = a % ( table, subquery )
-          response = self.respond( 'Subquery', sql, parlist )
           if POP:
-               self.deletesub( subquery, parlist, table )
-          return response
+               return self.popsub( subquery, parlist, table )
+          a = 'SELECT kid, tunix, notes, pzblob FROM %s %s'
+          sql = a % ( self.source( table ), subquery )
+          return self.respond( 'Subquery', sql, parlist )
+
+     def popsub( self, subquery='', parlist=[], table=Base.tab0 ):
+          '''Retrieve and delete rows matching subquery, atomically.'''
+          with self.session() as s:
+               layout = s.layout( table )
+               if s.RETURNING and not ( layout and ( layout['split'] or layout['ttl'] ) ):
+                    a = 'DELETE FROM %s %s RETURNING kid, tunix, notes, pzblob'
+                    return s.respond( 'Subquery', a % ( table, subquery ), parlist )
+                    #  one statement: the very rows deleted are returned.
+               a = 'SELECT kid, tunix, notes, pzblob FROM %s %s'
+               response = s.respond( 'Subquery', a % ( s.source( table ), subquery ),
+                                     parlist )
+               s.deletesub( subquery, parlist, table )
+               #  The session holds the write lock from SELECT to DELETE,
+               #  so no row can slip in between, nor be taken twice.
+               #  (Split tables: pzblob is gone once the row is deleted.)
+               return response
 
      #       __________ Using POP for QUEUE purposes         ___ATTN___ 
      #
@@ -930,16 +2304,18 @@ class Subquery( Util, Answer, Deletion ):
      #       retrieved and then DELETED.
      #     
      #       POP = False, means "retrieve but DO NOT delete."        <=!
+     #
+     #  Each POP is a single write transaction (see popsub), so concurrent
+     #  consumers in other processes never receive the same object.
 
      def diclast( self, m=1, table=Base.tab0, POP=False ):
-          '''Get dictionary with last m consecutive kids in table.'''
-          kid = self.lastkid( table ) - m 
-          return self.dicsub('WHERE kid > ?', [kid], table, POP )
+          '''Get dictionary with last m kids in table.'''
+          subquery, parlist = self.lastsub( m, table )
+          return self.dicsub( subquery, parlist, table, POP )
 
      def diccomma( self, csvstr, table=Base.tab0, wild=True, POP=False ):
           '''Get dictionary where notes match comma separated values.'''
-          parlist  = self.comma2list( csvstr, wild )
-          subquery = self.notesglob( parlist )
+          subquery, parlist = self.commasub( csvstr, table, wild )
           return self.dicsub( subquery, parlist, table, POP )
 
      def selectdic( self, dual=1, table=Base.tab0, POP=False ):
@@ -953,6 +2329,188 @@ class Subquery( Util, Answer, Deletion ):
                return self.diccomma( dual, table, wild, POP )
 
 
+     #       __________ METADATA only, never touching pzblob
+     #
+     #  Dashboards and cleanup jobs often need only kids, timestamps and
+     #  notes.  Since pzblob is the last column, SQLite stops reading each
+     #  row before its blob -- no decompression, no overflow pages.
+
+     def notessub(self, subquery='', parlist=[], table=Base.tab0):
+          '''Get dictionary kid: [tunix, notes] of rows matching subquery.'''
+          sql = 'SELECT kid, tunix, notes FROM %s %s' % ( self.visible( table ), subquery )
+          return self.respond( 'Notes', sql, parlist )
+
+     def kidsub(self, subquery='', parlist=[], table=Base.tab0):
+          '''Get sorted list of kids of rows matching subquery.'''
+          sql = 'SELECT kid FROM %s %s' % ( self.visible( table ), subquery )
+          return sorted( self.respond( 'Kids', sql, parlist ).keys() )
+
+     def countsub(self, subquery='', parlist=[], table=Base.tab0):
+          '''Count the rows matching subquery.'''
+          sql = 'SELECT COUNT(*) FROM %s %s' % ( self.visible( table ), subquery )
+          return self.respond( 'Answer', sql, parlist )[0][0]
+
+     def notescomma( self, csvstr, table=Base.tab0, wild=True ):
+          '''Get kid: [tunix, notes] where notes match comma separated values.'''
+          subquery, parlist = self.commasub( csvstr, table, wild )
+          return self.notessub( subquery, parlist, table )
+
+     def kidcomma( self, csvstr, table=Base.tab0, wild=True ):
+          '''Get sorted kids where notes match comma separated values.'''
+          subquery, parlist = self.commasub( csvstr, table, wild )
+          return self.kidsub( subquery, parlist, table )
+
+     def countcomma( self, csvstr, table=Base.tab0, wild=True ):
+          '''Count rows where notes match comma separated values.'''
+          subquery, parlist = self.commasub( csvstr, table, wild )
+          return self.countsub( subquery, parlist, table )
+
+
+     #       __________ ITERATORS which stream rather than build dictionary
+     #
+     #  dicsub decodes every match into one dictionary before returning.
+     #  The iter* methods instead yield (kid, tunix, notes, obj) one row
+     #  at a time in kid order, fetching FETCH rows per trip, so memory
+     #  stays flat and a consumer may stop early, e.g.
+     #
+     #       for kid, tunix, notes, obj in I.itercomma( '#plan', 'goldfinger' ):
+     #            if obj == 911:
+     #                 break
+     #
+     #  The connection is held until the iterator is exhausted, closed, or
+     #  garbage collected.  Under the default rollback journal that open
+     #  read blocks writers from committing, so prefer a WAL Base.PROFILE
+     #  if you interleave writes with a long iteration.
+
+     FETCH = 256
+     #       ^rows per fetchmany.
+
+     def itersub(self, subquery='', parlist=[], table=Base.tab0,
+                                                  recentfirst=False):
+          '''Iterate (kid, tunix, notes, obj) matching subquery, by kid.'''
+          a = 'SELECT kid, tunix, notes, pzblob FROM %s %s ORDER BY kid %s'
+          sql = a % ( self.source( table ), subquery,
+                      recentfirst and 'DESC' or 'ASC' )
+          return self.iterows( sql, parlist )
+
+     def iterows( self, sql, parlist=[] ):
+          '''Iterate (kid, tunix, notes, obj) selected by complete sql.'''
+          con = self.connect()
+          cur = con.cursor()
+          try:
+               try:
+                    cur.execute( sql, parlist )
+                    rows = cur.fetchmany( self.FETCH )
+               except:
+                    a = " !! Subquery.iterows choked on               \n"
+                    b = "           this sql and parameter list:     \n"
+                    raise IOError, "%s%s%s\n%s" % ( a, b, sql, parlist )
+               while rows:
+                    for kid, tunix, notes, pzblob in rows:
+                         yield ( kid, tunix, notes, pzloads( pzblob ) )
+                    rows = cur.fetchmany( self.FETCH )
+          finally:
+               cur.close()
+               self.release( con )
+
+     def iterlast( self, m=1, table=Base.tab0 ):
+          '''Iterate the last m kids in table, by kid.'''
+          subquery, parlist = self.lastsub( m, table )
+          return self.itersub( subquery, parlist, table )
+
+     def itercomma( self, csvstr, table=Base.tab0, wild=True,
+                                                  recentfirst=False ):
+          '''Iterate rows where notes match comma separated values.'''
+          subquery, parlist = self.commasub( csvstr, table, wild )
+          return self.itersub( subquery, parlist, table, recentfirst )
+
+
+     #       __________ TIME RANGES of insertion, by tunix index
+     #
+     #  Times are unix seconds, e.g. time.time(); a range includes t1 but
+     #  excludes t2, and None leaves that end open.  What changed in the
+     #  last hour, newest first:
+     #
+     #       now = time.time()
+     #       for kid, tunix, notes, obj in I.iterrange( now - 3600, None,
+     #                                     'goldfinger', recentfirst=True ):
+     #            ...
+     #
+     #  The first range query on a table creates its tunix index.
+
+     def rangesub( self, t1=None, t2=None, table=Base.tab0 ):
+          '''Subquery and parameter list for t1 <= tunix < t2, indexed.'''
+          layout = self.layout( table )
+          if layout is not None and 'tunix' not in layout['indexed']:
+               self.ensureindex( 'tunix', table )
+          conds, parlist = [], []
+          if t1 is not None:
+               conds.append( 'tunix >= ?' )
+               parlist.append( t1 )
+          if t2 is not None:
+               conds.append( 'tunix < ?' )
+               parlist.append( t2 )
+          if not conds:
+               return ( '', [] )
+          return ( 'WHERE %s ' % ' AND '.join( conds ), parlist )
+
+     def dicrange( self, t1=None, t2=None, table=Base.tab0, POP=False ):
+          '''Get dictionary of rows inserted from time t1 until t2.'''
+          subquery, parlist = self.rangesub( t1, t2, table )
+          return self.dicsub( subquery, parlist, table, POP )
+
+     def iterrange( self, t1=None, t2=None, table=Base.tab0, recentfirst=False ):
+          '''Iterate (kid, tunix, notes, obj) inserted from t1 until t2.'''
+          subquery, parlist = self.rangesub( t1, t2, table )
+          a = 'SELECT kid, tunix, notes, pzblob FROM %s %s ORDER BY tunix %s, kid %s'
+          order = recentfirst and 'DESC' or 'ASC'
+          sql = a % ( self.source( table ), subquery, order, order )
+          return self.iterows( sql, parlist )
+          #  Ordered as the tunix index is (ties by kid, which the index
+          #  entries carry), so rows stream without a sort.
+
+     def countrange( self, t1=None, t2=None, table=Base.tab0 ):
+          '''Count rows inserted from time t1 until t2.'''
+          subquery, parlist = self.rangesub( t1, t2, table )
+          return self.countsub( subquery, parlist, table )
+
+
+     #       __________ FULL-TEXT search over notes, see Care.ftsindex
+     #
+     #  Notes are tokenized into words (case and accents ignored), and
+     #  queries use the FTS5 syntax, e.g. 'agent007 AND (paris OR london)',
+     #  '"secret plan"' for a phrase, 'agen*' for a prefix:
+     #
+     #       dic = I.ftssub( 'agent007 AND paris', 'goldfinger' )
+     #       for kid, tunix, notes, obj in I.iterfts( 'plan*', 'goldfinger', 3 ):
+     #            ...   # the best three matches, by rank (BM25).
+     #
+     #  Both look up the full-text index, then fetch the matching rows
+     #  by kid -- the table itself is never scanned.
+
+     def ftssub( self, query, table=Base.tab0, POP=False ):
+          '''Get dictionary of rows whose notes match the FTS5 query.'''
+          subquery = 'WHERE kid IN (SELECT rowid FROM %s_fts WHERE %s_fts MATCH ?)'
+          return self.dicsub( subquery % ( table, table ), [ query ], table, POP )
+
+     def ftscomma( self, csvstr, table=Base.tab0, POP=False ):
+          '''Get dictionary where notes contain all comma separated words.'''
+          return self.ftssub( self.ftsquery( csvstr ), table, POP )
+
+     def iterfts( self, query, table=Base.tab0, m=None ):
+          '''Iterate (kid, tunix, notes, obj) matching FTS5 query, best first.'''
+          a = 'SELECT o.kid, o.tunix, o.notes, o.pzblob'
+          b = 'FROM %s_fts CROSS JOIN %s AS o ON o.kid = %s_fts.rowid'
+          #                  ^CROSS fixes the full-text index as outer loop.
+          c = 'WHERE %s_fts MATCH ? ORDER BY %s_fts.rank LIMIT ?'
+          sql = ' '.join([ a, b % ( table, self.source( table ), table ),
+                           c % ( table, table ) ])
+          if m is None:
+               m = -1
+               #   ^no limit
+          return self.iterows( sql, [ query, m ] )
+
+
 
 class Display( Subquery ):
      '''_______________ View subquery via pretty print'''
@@ -988,14 +2546,13 @@ class Display( Subquery ):
                print " !!  Display: NOTHING matched subquery !!"
 
      def viewlast( self, m=1, table=Base.tab0, POP=False ):
-          '''Print last m consecutive kids in table.'''
-          kid = self.lastkid( table ) - m 
-          self.viewsub('WHERE kid > ?', [kid], table, POP )
+          '''Print last m kids in table.'''
+          subquery, parlist = self.lastsub( m, table )
+          self.viewsub( subquery, parlist, table, POP )
 
      def viewcomma(self, csvstr='', table=Base.tab0, wild=True, POP=False):
           '''Print dictionary where notes match comma separated values.'''
-          parlist  = self.comma2list( csvstr, wild )
-          subquery = self.notesglob( parlist )
+          subquery, parlist = self.commasub( csvstr, table, wild )
           self.viewsub( subquery, parlist, table, POP )
 
      def view( self, dual=1, table=Base.tab0, POP=False ):
@@ -1017,41 +2574,50 @@ class Latest( Display ):
 
      def omaxsub(self, subquery='', parlist=[], table=Base.tab0, POP=False):
           '''Get the latest object omax which matches subquery.'''
-          dic = self.dicsub( subquery, parlist, table )
-          dickeylist = self.reverse_dickeys( dic )
-          diclen  = len( dickeylist )
-          #         count how many matched subquery
-          if diclen:
-               keymax = dickeylist[0]
-               # ^MAX DIC KEY of the LATEST matching subquery.
+          return self.endsub( subquery, parlist, table, POP, recentfirst=True )
+
+     def endsub( self, subquery, parlist, table, POP, recentfirst=True ):
+          '''Get object at either end (by kid) of rows matching subquery.'''
+          order = recentfirst and 'DESC' or 'ASC'
+          if POP:
+               #    ^queue-like deletion of only single object:
+               a = 'WHERE kid = (SELECT kid FROM %s %s ORDER BY kid %s LIMIT 1)'
+               dic = self.popsub( a % ( self.visible( table ), subquery, order ),
+                                  parlist, table )
+          else:
+               a = 'SELECT kid, tunix, notes, pzblob FROM %s %s ORDER BY kid %s LIMIT 1'
+               sql = a % ( self.source( table ), subquery, order )
+               dic = self.respond( 'Subquery', sql, parlist )
+          #  SQLite walks the key index from the proper end and stops at
+          #  the first match, so only that single object gets decoded.
+          if dic:
+               [ keymax ] = dic.keys()
                #        dic[keymax][0] corresponds to tunix.
                #        dic[keymax][1] corresponds to notes.
                omax   = dic[keymax][2]
-               #  ^this is the LATEST OBJECT matching subquery.
-               if POP:
-               #    ^queue-like deletion of only single object:
-                    self.deletekid( keymax, table )
+               #  ^this is the LATEST (or oldest) OBJECT matching subquery.
           else:
                omax = None
           return omax
 
      def omaxlast( self, n=0, table=Base.tab0, POP=False ):
           '''Most quickly get the latest n-th object using key index.'''
-          #               n = 0,1,2,...  assuming consecutive kids.
+          #               n = 0,1,2,...  counting rows which exist,
+          #               so gaps left by deletion do not matter.
           #  Avoiding LIKE or GLOB enhances performance in large tables.
           #  Also we are not reading an entire table into memory since a
           #  blank subquery would have put an entire table into dictionary.
           #
-          subquery = "WHERE kid=(SELECT MAX(kid) - ? FROM %s)" % table
-          obj = self.omaxsub( subquery, [n], table, POP )
+          a = "WHERE kid=(SELECT kid FROM %s ORDER BY kid DESC LIMIT 1 OFFSET ?)"
+          obj = self.omaxsub( a % self.visible( table ), [n], table, POP )
+          #                        ^expired rows not yet reaped are not counted.
           if DEBUG and obj == None:
                print " !! omaxlast: that kid does not exist."
           return obj
 
      def omaxcomma( self, csvstr, table=Base.tab0, wild=True, POP=False ):
           '''Get latest object where notes match comma separated values.'''
-          parlist  = self.comma2list( csvstr, wild )
-          subquery = self.notesglob( parlist )
+          subquery, parlist = self.commasub( csvstr, table, wild )
           return self.omaxsub( subquery, parlist, table, POP )
 
      def select( self, dual=0, table=Base.tab0, POP=False ):
@@ -1071,43 +2637,95 @@ class Latest( Display ):
           return self.omaxsub( subquery, [ kid ], table, POP )
           #  added 2010-06-07  can't believe this was missing ;-)
 
+     KIDCHUNK = 500
+     #  kids per IN (...) query of getkids, below the 999 parameters
+     #  which older SQLite versions allow per statement.
+
+     def getkids( self, kids, table=Base.tab0, POP=False ):
+          '''Retrieve rows for a list of kids at once: (objs, missing).'''
+          #  objs lists the objects in the order of kids (None where the
+          #  kid was missing), and missing lists the kids not found, e.g.
+          #       objs, missing = I.getkids( [7, 3, 12], 'goldfinger' )
+          #  A few queries of KIDCHUNK kids each, instead of one per kid.
+          #  With POP, all of it is one transaction (see session).
+          kids   = list( kids )
+          unique = sorted( set( kids ) )
+          found  = {}
+          def fetch( host ):
+               for i in range( 0, len( unique ), self.KIDCHUNK ):
+                    chunk = unique[ i : i + self.KIDCHUNK ]
+                    subquery = 'WHERE kid IN (%s)' % ','.join( '?' * len( chunk ) )
+                    dic = host.dicsub( subquery, chunk, table, POP )
+                    for kid in dic:
+                         found[kid] = dic[kid][2]
+          if POP:
+               with self.session() as s:
+                    fetch( s )
+          else:
+               fetch( self )
+               #  reading needs no write lock; the pooled connection
+               #  serves all chunks in turn.
+          objs    = [ found.get( kid ) for kid in kids ]
+          missing = [ kid for kid in kids if kid not in found ]
+          return ( objs, missing )
+
 
 
 class Oldest( Latest ):
      '''_______________ Retrieve the oldest qualified object "omin" '''
 
+     def ominsub(self, subquery='', parlist=[], table=Base.tab0, POP=False):
+          '''Get the oldest object omin which matches subquery.'''
+          return self.endsub( subquery, parlist, table, POP, recentfirst=False )
+
      def ominfirst( self, n=0, table=Base.tab0, POP=False ):
           '''Most quickly get the oldest n-th object using key index.'''
-          #               n = 0,1,2,...  assuming consecutive kids.
-          subquery = "WHERE kid=(SELECT MIN(kid) + ? FROM %s)" % table
-          obj = self.omaxsub( subquery, [n], table, POP )
-          #          ^works because its dictionary is single entry.
+          #               n = 0,1,2,...  counting rows which exist.
+          a = "WHERE kid=(SELECT kid FROM %s ORDER BY kid ASC LIMIT 1 OFFSET ?)"
+          obj = self.ominsub( a % self.visible( table ), [n], table, POP )
           if DEBUG and obj == None:
                print " !! ominfirst: that kid does not exist."
           return obj
 
-     def fifo( self, table=Base.tab0 ):
+     def omincomma( self, csvstr, table=Base.tab0, wild=True, POP=False ):
+          '''Get oldest object where notes match comma separated values.'''
+          subquery, parlist = self.commasub( csvstr, table, wild )
+          return self.ominsub( subquery, parlist, table, POP )
+
+     def fifo( self, table=Base.tab0, timeout=0 ):
           '''FIFO queue: return oldest object, then POP (delete) it.'''
+          #  If table is empty, wait up to timeout seconds for an object
+          #  (None: for ever) rather than return None at once.  Never with
+          #  a timeout within a session: IOError, see Base.block.
           n   = 0
           POP = True
-          return self.ominfirst( n, table, POP )
+          if not timeout and timeout is not None:
+               return self.ominfirst( n, table, POP )
+          return self.block( lambda: self.ominfirst( n, table, POP ), timeout )
 
 
 
 class Care( Answer, Deletion ):
      '''_______________ Maintenance methods'''
 
-     def freshen( self, freshdays=None, table=Base.tab0 ):
+     def freshen( self, freshdays=None, table=Base.tab0, chunk=0 ):
           '''Delete rows in table over freshdays-old since last insert.'''
           #         freshdays could be fractional days, e.g. 2.501 days;
           #                   if it is None, then it's infinity.
           #                   if it is 0, then nothing will remain.
+          #  chunk: 0 for one DELETE, else windows of chunk kids, each 
+          #         committed in turn (see Deletion.deletechunks).
           if freshdays != None :
                max_tunix  = self.lastsec( table )
                freshsecs  = int( freshdays * 86400 )
                expiration = max_tunix - freshsecs
                sql        = "WHERE tunix <= ?"
-               self.deletesub( sql, [expiration], table )
+               if chunk:
+                    self.ensureindex( 'tunix', table )
+                    #  ^so that the stale kids are found without a scan.
+                    self.deletechunks( sql, [expiration], table, chunk=chunk )
+               else:
+                    self.deletesub( sql, [expiration], table )
 
      def vacuum( self ):
           '''Defrag entire database, i.e. all tables therein.'''
@@ -1126,11 +2744,255 @@ class Care( Answer, Deletion ):
           #  aligns table data to be contiguous, and otherwise cleans up 
           #  the database file structure." -- sqlite.org
           #  N.B. -  Surprising how much file size will shrink.
-
-     def clean( self, freshdays=None, table=Base.tab0 ):
+          #
+          #  But it rewrites every page while holding an exclusive lock,
+          #  so readers and writers wait it out.  See incremental_vacuum
+          #  for freeing pages a few at a time, and compact_to for a 
+          #  defragmented copy made without locking out writers.
+
+     VACSTEP  = 1000
+     #  incremental_vacuum frees at most VACSTEP pages per transaction,
+     VACPAUSE = 0.01
+     #  then pauses VACPAUSE seconds so that others get the lock.
+
+     def autovacuum( self, mode='INCREMENTAL' ):
+          '''Set auto_vacuum mode: NONE, FULL or INCREMENTAL (VACUUM to convert).'''
+          modes = { 'NONE' : 0, 'FULL' : 1, 'INCREMENTAL' : 2 }
+          if self.rows( 'PRAGMA auto_vacuum' )[0][0] != modes[ mode ]:
+               con = None
+               try:
+                    con = self.connect()
+                    con.execute( 'PRAGMA auto_vacuum = %s' % mode )
+                    con.execute( 'VACUUM' )
+               except:
+                    if con is not None:
+                         self.release( con, broken=True )
+                    raise IOError, " !! Care.autovacuum: could not set %s" % mode
+               self.release( con )
+          return mode
+          #  A brand new database takes the mode at once, but an existing 
+          #  one only by a full VACUUM on the same connection -- so the 
+          #  conversion costs one blocking VACUUM, once.  The mode is then 
+          #  recorded in the database file itself.
+
+     def incremental_vacuum( self, pages=None ):
+          '''Free up to pages (None: all) free pages, VACSTEP at a time; count.'''
+          if self.rows( 'PRAGMA auto_vacuum' )[0][0] != 2:
+               return 0
+               #  ^only INCREMENTAL keeps the pointer maps needed, see autovacuum.
+          free0 = free = self.rows( 'PRAGMA freelist_count' )[0][0]
+          if pages is not None:
+               free = min( free, pages )
+          while free > 0:
+               step = min( free, self.VACSTEP )
+               self.rows( 'PRAGMA incremental_vacuum( %d )' % step )
+               #  ^each step is its own short write transaction.
+               free -= step
+               if free > 0:
+                    time.sleep( self.VACPAUSE )
+          return free0 - self.rows( 'PRAGMA freelist_count' )[0][0]
+          #  Unlike VACUUM, this does not defragment: it moves pages from 
+          #  the end of the file into free slots, then truncates the file.
+
+     def compact_to( self, path ):
+          '''Write a defragmented copy of the database to path (VACUUM INTO).'''
+          if os.path.exists( path ):
+               raise IOError, " !! Care.compact_to: will not overwrite %s" % path
+          self.rows( 'VACUUM INTO ?', [ path ] )
+          return path
+          #  VACUUM INTO only reads the database: under WAL journal (see 
+          #  PROFILE) writers carry on while the copy is made, and the copy 
+          #  is a consistent snapshot.  Swapping the copy into place is left 
+          #  to the caller, when nobody has the database open.
+
+     def splittable( self, table=Base.tab0 ):
+          '''Migrate table to the split layout, moving pzblob to t_pz.'''
+          #  One transaction, so other processes see either layout whole.
+          #  Their cached layout goes stale: their next insert notices,
+          #  but long-running readers should call I.known.clear() once.
+          layout = self.layout( table )
+          if layout is None or layout['split']:
+               return ' :: splittable: nothing to do.'
+          d = { 't' : table }
+          with self.session() as s:
+               columns, names = [], []
+               for cid, name, kind, notnull, default, pk in s.rows(
+                                        'PRAGMA table_info( %s )' % table ):
+                    if name == 'pzblob':
+                         continue
+                    if pk:
+                         kind += ' PRIMARY KEY'
+                    if default is not None:
+                         kind += ' DEFAULT %s' % default
+                    columns.append( '%s %s' % ( name, kind ) )
+                    names.append( name )
+               #  ^every column but pzblob, e.g. those of a queue table.
+               d['columns'] = ', '.join( columns )
+               d['names']   = ', '.join( names )
+               a = "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ?"
+               indexes = [ i[0] for i in s.rows( a, [ table ] ) if i[0] ]
+               #  ^as created (e.g. by ensureindex or queuetable), to be
+               #   created again on the new table.
+               if layout['ttl']:
+                    s.proceed( 'DROP VIEW %(t)s_live' % d )
+                    #  ^it reads the table being replaced; rigged again below.
+               for sql in [
+               'CREATE TABLE %(t)s_pz (kid INTEGER PRIMARY KEY, pzblob BLOB)',
+               'INSERT INTO %(t)s_pz (kid, pzblob) SELECT kid, pzblob FROM %(t)s',
+               'CREATE TABLE %(t)s_new (%(columns)s)',
+               '''INSERT INTO %(t)s_new (%(names)s)
+                    SELECT %(names)s FROM %(t)s''',
+               'DROP TABLE %(t)s',
+               'ALTER TABLE %(t)s_new RENAME TO %(t)s' ]:
+                    s.proceed( sql % d )
+               for sql in indexes:
+                    s.proceed( sql )
+               s.splitrig( table )
+               if layout['tags']:
+                    s.tagrig( table )
+               if layout['trigrams']:
+                    s.tririg( table )
+               if layout['fts']:
+                    s.ftsrig( table )
+               if layout['ttl']:
+                    s.liverig( table, split=True )
+                    #  ^texp and its index t_exp came along with the rest.
+               if layout['cap']:
+                    s.caprig( table, split=True )
+                    #  ^byte count triggers now on t_pz, which holds pzblob.
+               #  (rebuilt rather than ALTER TABLE DROP COLUMN, which
+               #   only exists as of SQLite 3.35 and leaves the space.)
+          self.known.pop( ( self.db, table ), None )
+          return ' :: splittable: done, VACUUM to reclaim the space.'
+
+     def tagindex( self, table=Base.tab0 ):
+          '''Index tags of notes in side table t_tag, kept up by insert.'''
+          #  Opt-in per table.  From then on, comma terms which are plain
+          #  tags, e.g. '#paris', are answered from the (tag, kid) index
+          #  instead of scanning every note (see Util.commasub).
+          layout = self.layout( table )
+          if layout is None or layout['tags']:
+               return ' :: tagindex: nothing to do.'
+          with self.session() as s:
+               s.tagrig( table )
+               cur = s.con.execute( 'SELECT kid, notes FROM %s' % table )
+               def generate_tagrows():
+                    for kid, notes in cur:
+                         for tag in s.tagsof( notes ):
+                              yield [ tag, kid ]
+               sql = 'INSERT OR IGNORE INTO %s_tag (tag, kid) VALUES (?, ?)'
+               s.proceed( sql % table, generate_tagrows() )
+               #  streams existing notes, without building a dictionary.
+          self.known.pop( ( self.db, table ), None )
+          return ' :: tagindex: done.'
+
+     def tagrig( self, table=Base.tab0 ):
+          '''Rig side table t_tag, its indexes and delete trigger.'''
+          self.claim( table, 'tag' )
+          d = { 't' : table }
+          for sql in [
+          'CREATE TABLE IF NOT EXISTS %(t)s_tag (tag TEXT, kid INTEGER)',
+          'CREATE UNIQUE INDEX IF NOT EXISTS %(t)s_tag_tk ON %(t)s_tag (tag, kid)',
+          #                     ^covering index: a tag's kids in order.
+          'CREATE INDEX IF NOT EXISTS %(t)s_tag_k ON %(t)s_tag (kid)',
+          #                     ^for the trigger below.
+          '''CREATE TRIGGER IF NOT EXISTS %(t)s_tag_del AFTER DELETE ON %(t)s
+               BEGIN DELETE FROM %(t)s_tag WHERE kid = OLD.kid; END''' ]:
+               self.proceed( sql % d )
+
+     def triindex( self, table=Base.tab0 ):
+          '''Index trigrams of notes in FTS5 table t_tri, kept up by triggers.'''
+          #  Opt-in per table.  From then on, comma terms with a literal
+          #  run of three or more characters, e.g. '*paris*', look up
+          #  candidate kids by trigram instead of scanning every note.
+          #  Needs SQLite 3.34 or later, compiled with FTS5.
+          layout = self.layout( table )
+          if layout is None or layout['trigrams']:
+               return ' :: triindex: nothing to do.'
+          with self.session() as s:
+               s.tririg( table )
+               s.proceed( "INSERT INTO %s_tri (%s_tri) VALUES ('rebuild')"
+                         % ( table, table ) )
+               #  ^indexes the existing notes.
+          self.known.pop( ( self.db, table ), None )
+          return ' :: triindex: done.'
+
+     def tririg( self, table=Base.tab0 ):
+          '''Rig FTS5 trigram table t_tri over notes, and its triggers.'''
+          #  External content: t_tri keeps only the index, reading notes
+          #  from the table itself by kid.  case_sensitive, as is GLOB.
+          self.claim( table, 'tri' )
+          d = { 't' : table }
+          for sql in [
+          '''CREATE VIRTUAL TABLE IF NOT EXISTS %(t)s_tri USING fts5( notes,
+               content='%(t)s', content_rowid='kid',
+               tokenize='trigram case_sensitive 1' )''',
+          '''CREATE TRIGGER IF NOT EXISTS %(t)s_tri_ins AFTER INSERT ON %(t)s
+               BEGIN INSERT INTO %(t)s_tri (rowid, notes)
+                    VALUES (NEW.kid, NEW.notes); END''',
+          '''CREATE TRIGGER IF NOT EXISTS %(t)s_tri_del AFTER DELETE ON %(t)s
+               BEGIN INSERT INTO %(t)s_tri (%(t)s_tri, rowid, notes)
+                    VALUES ('delete', OLD.kid, OLD.notes); END''' ]:
+               self.proceed( sql % d )
+
+     def ftsindex( self, table=Base.tab0 ):
+          '''Index words of notes in FTS5 table t_fts, kept up by triggers.'''
+          #  Opt-in per table, for ftssub, ftscomma and iterfts.
+          #  Needs SQLite compiled with FTS5 (standard as of 3.9).
+          layout = self.layout( table )
+          if layout is None or layout['fts']:
+               return ' :: ftsindex: nothing to do.'
+          with self.session() as s:
+               s.ftsrig( table )
+               s.proceed( "INSERT INTO %s_fts (%s_fts) VALUES ('rebuild')"
+                         % ( table, table ) )
+          self.known.pop( ( self.db, table ), None )
+          return ' :: ftsindex: done.'
+
+     def ftsrig( self, table=Base.tab0 ):
+          '''Rig FTS5 full-text table t_fts over notes, and its triggers.'''
+          #  External content, as in tririg.  The prefix option adds
+          #  indexes for 2 and 3 character prefixes, e.g. 'ag*'.
+          self.claim( table, 'fts' )
+          d = { 't' : table }
+          for sql in [
+          '''CREATE VIRTUAL TABLE IF NOT EXISTS %(t)s_fts USING fts5( notes,
+               content='%(t)s', content_rowid='kid', prefix='2 3' )''',
+          '''CREATE TRIGGER IF NOT EXISTS %(t)s_fts_ins AFTER INSERT ON %(t)s
+               BEGIN INSERT INTO %(t)s_fts (rowid, notes)
+                    VALUES (NEW.kid, NEW.notes); END''',
+          '''CREATE TRIGGER IF NOT EXISTS %(t)s_fts_del AFTER DELETE ON %(t)s
+               BEGIN INSERT INTO %(t)s_fts (%(t)s_fts, rowid, notes)
+                    VALUES ('delete', OLD.kid, OLD.notes); END''' ]:
+               self.proceed( sql % d )
+
+     def captable( self, table=Base.tab0, maxrows=None, maxbytes=None ):
+          '''Cap table at maxrows rows and/or maxbytes of pzblob; evict oldest.'''
+          #  A rolling log: from now on every insert also deletes, in the 
+          #  same transaction, the oldest rows beyond either cap -- instead
+          #  of freshen plus clean from cron.  None means no such cap;
+          #  call again to change the caps.
+          with self.session() as s:
+               layout = s.fresh( table )
+               if not layout['cap']:
+                    s.caprig( table, layout['split'] )
+               a = 'UPDATE %s_cap SET maxrows = ?, maxbytes = ?'
+               s.proceed( a % table, [[ maxrows, maxbytes ]] )
+               s.known.pop( ( s.db, table ), None )
+               evicted = s.evict( table )
+          self.known.pop( ( self.db, table ), None )
+          return evicted
+          #  Freed pages are reused by later inserts, so the file size 
+          #  levels off too, without any VACUUM.
+
+     def clean( self, freshdays=None, table=Base.tab0, chunk=0 ):
           '''Delete stale rows after freshdays; vacuum/defrag database.'''
-          self.freshen( freshdays, table )
-          self.vacuum()
+          self.freshen( freshdays, table, chunk )
+          if self.rows( 'PRAGMA auto_vacuum' )[0][0] == 2:
+               self.incremental_vacuum()
+               #  ^paced, instead of locking everyone out for a full VACUUM.
+          else:
+               self.vacuum()
           return ''
 
 
@@ -1139,7 +3001,7 @@ class Main( Annex, Oldest, Care ):
      '''_______________ Summary for use of a single database.'''
      pass
      #                  Base
-     #        Insertion(Base)
+     #        Insertion(Base, Util)
      #  Annex(Insertion)
      #                                                              Util
      #                                       Answer(          Base)
@@ -1152,6 +3014,183 @@ class Main( Annex, Oldest, Care ):
 
 
 
+class Queue( Main ):
+     '''_______________ Work queue: batches, leases, ack/nack, dead letters.'''
+     #  fifo deletes as it delivers, so a consumer which crashes loses its
+     #  object.  Here dequeue only leases objects for LEASE seconds:
+     #
+     #       Q = y_serial.Queue( '/tmp/agency.sqlite' )
+     #       Q.enqueue( [ (obj1, '#job'), (obj2, '#job') ], 'jobs' )
+     #       for receipt, notes, obj in Q.dequeue( 100, 'jobs' ):
+     #            ...  work on obj ...
+     #            Q.ack( [ receipt ], 'jobs' )
+     #            #    ^or Q.nack to hand it back for another try.
+     #
+     #  Objects not acked before their lease expires are delivered again.
+     #  An object delivered more than TRIES times goes instead to the
+     #  dead-letter table t_dead (same columns, plus qkid, its kid in the
+     #  queue, tries and tdead), which the usual methods can read, e.g.
+     #  Q.dicsub( '', [], 'jobs_dead' ).  t_dead numbers its own kids.
+     #
+     #  A receipt is ( kid, lease ), where lease is a random token drawn
+     #  afresh for each delivery: ack and nack do nothing once that lease
+     #  has expired and the object was delivered to someone else -- nor
+     #  once the object was acked and its kid reused by a later enqueue
+     #  (kid INTEGER PRIMARY KEY hands out max( kid ) + 1 again).  Every
+     #  method is one transaction, safe across threads and processes.
+     #
+     #  Priority and delay:  Q.enqueue( objseq, 'jobs', prio=9, delay=60 )
+     #  enqueues objects which no one gets within the next minute, but
+     #  which thereafter go before any of lower priority (default 0).
+     #  Each dequeue seeks the index on (prio, tvisible, kid) once per
+     #  priority level present, so a long queue, or a backlog of leased
+     #  or delayed objects, costs no more than a short one.
+
+     LEASE = 30
+     #       ^seconds a dequeued object stays invisible to others.
+     TRIES = 5
+     #       ^deliveries before an object is dead-lettered.
+
+     def queuetable( self, table=Base.tab0 ):
+          '''Create queue table, or convert a table; with t_dead, index.'''
+          d = { 't' : table }
+          with self.session() as s:
+               layout = s.current( table )
+               #  ^checked under the write lock: other processes may be
+               #   creating the same queue, or may have dropped it.
+               if layout and layout['queue']:
+                    return
+               s.claim( table, 'dead' )
+               if layout is None:
+                    s.proceed( '''CREATE TABLE IF NOT EXISTS %(t)s
+                         (kid INTEGER PRIMARY KEY, tunix INTEGER, notes TEXT,
+                         pzblob BLOB, tvisible REAL DEFAULT 0,
+                         tries INTEGER DEFAULT 0, prio INTEGER DEFAULT 0,
+                         lease INTEGER)''' % d )
+               else:
+                    names = [ i[1] for i in s.rows( 'PRAGMA table_info( %s )' % table ) ]
+                    for name, kind in [ ( 'tvisible', 'REAL DEFAULT 0' ),
+                                        ( 'tries',    'INTEGER DEFAULT 0' ),
+                                        ( 'prio',     'INTEGER DEFAULT 0' ),
+                                        ( 'lease',    'INTEGER' ) ]:
+                         if name not in names:
+                              s.proceed( 'ALTER TABLE %s ADD COLUMN %s %s'
+                                         % ( table, name, kind ) )
+                    #    ^existing rows become ready for delivery.
+               for sql in [
+               'CREATE INDEX IF NOT EXISTS %(t)s_vis ON %(t)s (prio, tvisible, kid)',
+               '''CREATE TABLE IF NOT EXISTS %(t)s_dead
+                    (kid INTEGER PRIMARY KEY, tunix INTEGER, notes TEXT,
+                    pzblob BLOB, qkid INTEGER, tries INTEGER, tdead REAL)''' ]:
+                    s.proceed( sql % d )
+          self.known.pop( ( self.db, table ), None )
+
+     def enqueue( self, objseq, table=Base.tab0, prio=0, delay=0 ):
+          '''Insert sequence of (obj, notes), ready after delay; kid range.'''
+          with self.session() as s:
+               s.queuetable( table )
+               rows, kid0, kid1 = s.ingenerator( iter( objseq ), table )
+               if rows and ( prio or delay ):
+                    a = 'UPDATE %s SET prio = ?, tvisible = ? WHERE kid BETWEEN ? AND ?'
+                    s.proceed( a % table, [[ prio, time.time() + delay, kid0, kid1 ]] )
+                    #  same transaction: no one sees them undelayed.
+          return ( kid0, kid1 )
+
+     def dequeue( self, n=1, table=Base.tab0, lease=None, timeout=0 ):
+          '''Lease up to n ready objects: list of (receipt, notes, obj).'''
+          #  Highest priority first; within a priority, oldest first:
+          #  new objects by kid, then expired leases and delayed objects.
+          #  At most KIDCHUNK objects per call.  If none is ready, wait up
+          #  to timeout seconds (None: for ever) for one, see Base.block --
+          #  outside a session only.
+          if timeout or timeout is None:
+               return self.block( lambda: self.dequeue( n, table, lease ),
+                                  timeout, ready=len )
+          if lease is None:
+               lease = self.LEASE
+          n = min( n, self.KIDCHUNK )
+          with self.session() as s:
+               s.queuetable( table )
+               now  = time.time()
+               kids = []
+               a = 'SELECT MAX( prio ) FROM %s WHERE prio < ?' % table
+               #    ^seeks the next lower priority present in the index.
+               b = '''SELECT kid FROM %s WHERE prio = ? AND tvisible <= ?
+                    ORDER BY tvisible, kid LIMIT ?''' % table
+               prio = s.rows( 'SELECT MAX( prio ) FROM %s' % table )[0][0]
+               while prio is not None and len( kids ) < n:
+                    kids += [ row[0] for row in s.rows( b, [ prio, now, n - len( kids ) ] ) ]
+                    prio = s.rows( a, [ prio ] )[0][0]
+               if not kids:
+                    return []
+               inkids = 'kid IN (%s)' % ','.join( '?' * len( kids ) )
+               a = '''UPDATE %s SET tvisible = ?, tries = tries + 1,
+                    lease = random() WHERE %s'''
+               #                 ^a fresh 64-bit token for each delivery.
+               s.proceed( a % ( table, inkids ), [ [ now + lease ] + kids ] )
+               a = '''SELECT q.kid, q.lease, q.tries, o.notes, o.pzblob
+                    FROM %s AS q JOIN %s AS o ON o.kid = q.kid
+                    WHERE q.%s'''
+               rows = s.rows( a % ( table, s.source( table ), inkids ), kids )
+               rank = dict( zip( kids, range( len( kids ) ) ) )
+               rows.sort( key=lambda row: rank[ row[0] ] )
+               #  ^delivery order, as picked above.
+               #  (a split table keeps pzblob apart, see splittable.)
+               dead = [ row[0] for row in rows if row[2] > s.TRIES ]
+               if dead:
+                    s.bury( dead, now, table )
+          return [ ( ( kid, token ), notes, pzloads( pzblob ) )
+                   for kid, token, tries, notes, pzblob in rows if tries <= self.TRIES ]
+          #  (decoded after COMMIT, so the write lock is held briefly.)
+
+     def bury( self, kids, now, table=Base.tab0 ):
+          '''Move rows with given kids to the dead-letter table t_dead.'''
+          with self.session() as s:
+               inkids = 'kid IN (%s)' % ','.join( '?' * len( kids ) )
+               a = '''INSERT INTO %s_dead (tunix, notes, pzblob, qkid, tries, tdead)
+                    SELECT q.tunix, q.notes, o.pzblob, q.kid, q.tries, ?
+                    FROM %s AS q JOIN %s AS o ON o.kid = q.kid WHERE q.%s'''
+               s.proceed( a % ( table, table, s.source( table ), inkids ),
+                          [ [ now ] + kids ] )
+               s.deletesub( 'WHERE %s' % inkids, kids, table )
+
+     def ack( self, receipts, table=Base.tab0 ):
+          '''Done with leased objects: delete them; count those still leased.'''
+          a = 'DELETE FROM %s WHERE kid = ? AND lease = ?' % table
+          return self.settle( a, [ list( r ) for r in receipts ] )
+
+     def nack( self, receipts, table=Base.tab0, delay=0 ):
+          '''Hand leased objects back, ready again after delay seconds.'''
+          a = 'UPDATE %s SET tvisible = ? WHERE kid = ? AND lease = ?' % table
+          t = time.time() + delay
+          return self.settle( a, [ [ t ] + list( r ) for r in receipts ] )
+
+     def reschedule( self, subquery='', parlist=[], table=Base.tab0, delay=0,
+                                                                 prio=None ):
+          '''Make rows matching subquery ready after delay; count them.'''
+          #  e.g. retry everything about agent007 in an hour, urgently:
+          #       Q.reschedule( 'WHERE notes GLOB ?', ['*agent007*'], 'jobs',
+          #                     3600, prio=9 )
+          #  Leased rows are rescheduled too; their receipts stay valid.
+          t = time.time() + delay
+          if prio is None:
+               a = 'UPDATE %s SET tvisible = ? %s' % ( table, subquery )
+               return self.settle( a, [ [ t ] + list( parlist ) ] )
+          a = 'UPDATE %s SET tvisible = ?, prio = ? %s' % ( table, subquery )
+          return self.settle( a, [ [ t, prio ] + list( parlist ) ] )
+
+     def settle( self, sql, parlist ):
+          '''Execute sql for each parameter list; count rows it affected.'''
+          with self.session() as s:
+               count = 'SELECT total_changes()'
+               before = s.rows( count )[0][0]
+               s.proceed( sql, parlist )
+               return s.rows( count )[0][0] - before
+               #  receipts whose lease expired (and was renewed by another
+               #  delivery) do not match, hence are not counted.
+
+
+
 #  _______________ COPY functions (demonstration outside of Main class)
 #                       also note how ingenerator is employed usefully.
 
@@ -1188,10 +3227,9 @@ def copysub( subquery, parlist, tablex, tabley, dbx=Base.db0, dby=Base.db0 ):
           print " !! copysub: table or database name(s) must differ."
 
 def copylast( m, tablex, tabley, dbx=Base.db0, dby=Base.db0 ):
-     '''Copy last m consecutive kids in tablex over to tabley.'''
-     A = Answer()
-     kid = A.lastkid( tablex ) - m 
-     copysub('WHERE kid > ?', [kid], tablex, tabley, dbx, dby )
+     '''Copy last m kids in tablex over to tabley.'''
+     subquery, parlist = Main( dbx ).lastsub( m, tablex )
+     copysub( subquery, parlist, tablex, tabley, dbx, dby )
 
 def comma( *string_args ):
      '''Join string-type arguments with comma (cf. csvstr, comma2list).'''
@@ -1200,9 +3238,7 @@ def comma( *string_args ):
 
 def copycomma( csvstr, tablex, tabley, dbx=Base.db0, dby=Base.db0, wild=True ):
      '''Subselect by comma separated values from tablex, then copy to tabley.'''
-     U = Util()
-     parlist  = U.comma2list( csvstr, wild )
-     subquery = U.notesglob( parlist )
+     subquery, parlist = Main( dbx ).commasub( csvstr, tablex, wild )
      copysub( subquery, parlist, tablex, tabley, dbx, dby )
 
 def copy( dual, tablex, tabley, dbx=Base.db0, dby=Base.db0, wild=True ):
@@ -1219,6 +3255,137 @@ def copy( dual, tablex, tabley, dbx=Base.db0, dby=Base.db0, wild=True ):
 
 import random
 
+class Compactor( threading.Thread ):
+     '''_______________ Background thread: vacuum databases on a schedule.'''
+     #  Instead of some unlucky insert paying for a vacuum of every barn 
+     #  (see Farm.plant), a daemon thread frees pages of each database 
+     #  every interval seconds by incremental_vacuum.
+
+     interval = 600
+     #          ^seconds between rounds.
+     pages    = None
+     #          ^most pages freed per database per round; None for all.
+
+     def __init__( self, dbs, interval=interval, pages=pages, convert=True ):
+          '''Set databases to compact every interval secs; convert to INCREMENTAL.'''
+          threading.Thread.__init__( self )
+          self.daemon    = True
+          #  ^never keeps the process alive.
+          self.dbs       = list( dbs )
+          self.interval  = interval
+          self.pages     = pages
+          self.convert   = convert
+          #  ^True: set auto_vacuum=INCREMENTAL first (one full VACUUM each).
+          self.converted = set()
+          self.halt      = threading.Event()
+          self.rounds    = 0
+          self.freed     = 0
+
+     def run( self ):
+          '''Compact every interval seconds until stop.'''
+          while not self.halt.isSet():
+               self.compact()
+               self.halt.wait( self.interval )
+
+     def compact( self ):
+          '''One round: incremental vacuum of each database; pages freed.'''
+          freed = 0
+          for db in self.dbs:
+               if not os.path.exists( db ):
+                    continue
+               try:
+                    C = Care( db )
+                    if self.convert and db not in self.converted:
+                         C.autovacuum( 'INCREMENTAL' )
+                         self.converted.add( db )
+                    freed += C.incremental_vacuum( self.pages )
+               except IOError:
+                    if DEBUG:
+                         print " :: Compactor: skipped %s" % db
+          self.rounds += 1
+          self.freed  += freed
+          return freed
+
+     def stop( self, timeout=None ):
+          '''Stop after the current round; wait up to timeout secs for it.'''
+          self.halt.set()
+          self.join( timeout )
+
+
+
+class Reaper( threading.Thread ):
+     '''_______________ Background thread: delete expired rows in batches.'''
+     #  Rows inserted with a ttl (see Insertion.insert) are hidden from 
+     #  reads once expired; the reaper reclaims them, n rows per short
+     #  transaction, for each (db, table) in targets.  While a batch 
+     #  comes back full it keeps going, pausing between batches, else
+     #  it sleeps interval seconds.
+
+     interval = 1
+     #          ^seconds to sleep once nothing more has expired.
+     pause    = 0.01
+     #          ^seconds between full batches, so that others get the lock.
+
+     def __init__( self, targets, interval=interval, n=Deletion.REAPN ):
+          '''Set (db, table) pairs to reap of expired rows, n rows per batch.'''
+          threading.Thread.__init__( self )
+          self.daemon   = True
+          self.targets  = list( targets )
+          self.interval = interval
+          self.n        = n
+          self.halt     = threading.Event()
+          self.rounds   = 0
+          self.reaped   = 0
+          self.tstart   = None
+          self.last     = ( 0, 0.0 )
+          #  ^( rows, seconds ) of the latest round.
+
+     def run( self ):
+          '''Reap until stop, going on at once while batches come back full.'''
+          self.tstart = time.time()
+          while not self.halt.isSet():
+               if self.reap() < self.n:
+                    self.halt.wait( self.interval )
+               else:
+                    self.halt.wait( self.pause )
+
+     def reap( self ):
+          '''One round: a batch from each target; count rows deleted.'''
+          t0 = time.time()
+          reaped, full = 0, 0
+          for db, table in self.targets:
+               try:
+                    got = Deletion( db ).expire( table, self.n )
+               except IOError:
+                    got = 0
+                    if DEBUG:
+                         print " :: Reaper: skipped %s in %s" % ( table, db )
+               reaped += got
+               full = max( full, got )
+          self.rounds += 1
+          self.reaped += reaped
+          self.last    = ( reaped, time.time() - t0 )
+          return full
+
+     def metrics( self ):
+          '''Get dictionary: rows reaped, seconds, rows reclaimed per second.'''
+          seconds = self.tstart and time.time() - self.tstart or 0.0
+          rows, busy = self.last
+          return { 'reaped'  : self.reaped,
+                   'rounds'  : self.rounds,
+                   'seconds' : seconds,
+                   'rate'    : seconds and self.reaped / seconds or 0.0,
+                   'burst'   : busy and rows / busy or 0.0 }
+          #  rate  is averaged over the life of the thread;
+          #  burst is the rate while deleting during the latest round.
+
+     def stop( self, timeout=None ):
+          '''Stop after the current round; wait up to timeout secs for it.'''
+          self.halt.set()
+          self.join( timeout )
+
+
+
 class Farm:
      '''_______________ Start a farm of databases for concurrency and scale.'''
      #  (Dependencies: Insertion, Deletion classes; copy function.)
@@ -1300,6 +3467,19 @@ class Farm:
           if DEBUG:
                print " :: cleanfarm: VACUUMed barns in %s" % self.dir
 
+     INLINE = True
+     #  True: plant itself vacuums all barns about every 100,000 inserts.
+     #  False once a background compactor is started, see compactor.
+
+     def compactor( self, interval=Compactor.interval, pages=Compactor.pages ):
+          '''Start a Compactor thread for all barns, instead of inline vacuum.'''
+          self.INLINE = False
+          barns = [ self.barn(n) for n in range( self.maxbarns ) ]
+          compactor = Compactor( barns, interval, pages )
+          compactor.start()
+          return compactor
+          #  Keep the returned thread to stop() it, e.g. at exit.
+
      def plant( self, obj, notes='#0notes', table=Base.tab0, dby=Base.db0 ):
           '''FARM SUMMARY: farmin insert with generic self-cleaning harvest.'''
           size = 10
@@ -1318,7 +3498,7 @@ class Farm:
                #  print "farmin barn%s" % n
                self.harvest( '', table, table, n, dby, wild, size )
                #   ^harvest whenever around size accumulates in a random barn.
-          if 100000 * random.random() < 1:
+          if self.INLINE and 100000 * random.random() < 1:
           #  vacuum of all barns approximately every 100,000 inserts.
                self.cleanfarm()
 
@@ -1396,6 +3576,8 @@ def pzdump(filename, *objects):
      #  objects with a for statement, or, depending on what you need, 
      #  you can use some call such as list(pzload('somefile.gz')) 
      #  to get a list with all recovered objects as its items.
+     #  !! Each object is a pz object with its codec byte (v0.80), which
+     #     pzload before v0.80 cannot decode.
 
 def pzload(filename):
      '''Iterate zlib-compressed pickled objects from a gz file.'''
@@ -1830,8 +4012,12 @@ def tester( database=Base.db0 ):
                objnotes = ( i, "testitem-%s" % i )
                yield objnotes
                #   ^yield, not return, for generators.
-     I.ingenerator( generate_testitems(2), 'ytest' )
-     ipass += 1
+     rows, kid0, kid1 = I.ingenerator( generate_testitems(2), 'ytest', chunk=1 )
+     if rows == 2 and kid1 == kid0 + 1:
+          print "passed test: ingenerator by chunks, rows and kid range."
+          ipass += 1
+     else:
+          print "TEST FAIL!   ingenerator by chunks, rows and kid range."
      #    --------------------------------
      tmp1 = ("Part of 3-tuple.", 98, 'Encode text in UTF-8.' )
      tmp2 = { 'spam' : 2 , 'eggs' : 43 }
@@ -1850,6 +4036,410 @@ def tester( database=Base.db0 ):
      lkid = I.lastkid( 'ytest' )
      print "     Checking last kid PRIMARY KEY: ", lkid
      ipass += 1
+     S = Main( database )
+     S.POOL = False
+     if S.lastkid( 'ytest' ) == lkid:
+          print "passed test: connect per call with POOL=False."
+          ipass += 1
+     else:
+          print "TEST FAIL!   connect per call with POOL=False."
+     U = Main( database )
+     U.SYNCHRONOUS = 'OFF'
+     unsafe = U.rows( 'PRAGMA synchronous' )[0][0]
+     #  ^its connection goes back to the pool with synchronous=OFF.
+     if unsafe == 0 and I.rows( 'PRAGMA synchronous' )[0][0] != 0:
+          print "passed test: pooled connection keeps pragmas to its tuning."
+          ipass += 1
+     else:
+          print "TEST FAIL!   pooled connection keeps pragmas to its tuning."
+     I.insert( 'first', 'schema cache', 'ytest3' )
+     S.proceed( 'DROP TABLE ytest3' )
+     #  ^behind the back of the schema cache, as another process might.
+     I.insert( 'again', 'schema cache', 'ytest3' )
+     if I.select( 0, 'ytest3' ) == 'again':
+          print "passed test: insert recovers from stale schema cache."
+          ipass += 1
+     else:
+          print "TEST FAIL!   insert after stale schema cache."
+     with I.session() as s:
+          s.insert( 'in session', 'session', 'ytest3' )
+          skid = s.lastkid( 'ytest3' )
+          sobj = s.getkid( skid, 'ytest3' )
+          s.deletekid( skid, 'ytest3' )
+     try:
+          with I.session() as s:
+               s.insert( 'rolled back', 'session', 'ytest3' )
+               raise ValueError
+     except ValueError:
+          pass
+     if sobj == 'in session' and I.lastkid( 'ytest3' ) == 1:
+          print "passed test: session commit and rollback."
+          ipass += 1
+     else:
+          print "TEST FAIL!   session commit and rollback."
+     before = I.countsub( '', [], 'ytest3' )
+     I.rows( "INSERT INTO ytest3 (notes) VALUES ('uncommitted')" )
+     if I.countsub( '', [], 'ytest3' ) == before:
+          print "passed test: pooled connection returns without a transaction."
+          ipass += 1
+     else:
+          print "TEST FAIL!   pooled connection returns without a transaction."
+     I.insert( 'plain', 'no ttl', 'ytest5' )
+     try:
+          with I.session() as s:
+               s.insert( 'rolled back', 'ttl', 'ytest5', ttl=60 )
+               raise ValueError
+     except ValueError:
+          pass
+     #  ^a layout cached in the rolled-back session would point at ytest5_live.
+     try:
+          ttlgone = len( I.dicsub( '', [], 'ytest5' ) ) == 1
+     except:
+          ttlgone = False
+     if ttlgone:
+          print "passed test: rollback forgets cached layout."
+          ipass += 1
+     else:
+          print "TEST FAIL!   rollback forgets cached layout."
+     I.insert( 'mine', 'not a dead letter', 'ytest5_dead' )
+     try:
+          Queue( database ).enqueue( [ ('q', 'job') ], 'ytest5' )
+          adopted = True
+     except IOError:
+          adopted = False
+     I.droptable( 'ytest5' )
+     if ( not adopted and I.select( 0, 'ytest5_dead' ) == 'mine'
+          and I.layout( 'ytest5' ) is None ):
+          print "passed test: user table named like a companion left alone."
+          ipass += 1
+     else:
+          print "TEST FAIL!   user table named like a companion left alone."
+     I.droptable( 'ytest5_dead' )
+     I.inbatch( [('b', 'gap'), ('c', 'gap')], 'ytest3' )
+     I.deletekid( 2, 'ytest3' )
+     if ( I.select( 1, 'ytest3' ) == 'again'
+          and I.ominfirst( 1, 'ytest3' ) == 'c'
+          and sorted( I.diclast( 2, 'ytest3' ).keys() ) == [1, 3] ):
+          print "passed test: omaxlast, ominfirst, diclast across a gap."
+          ipass += 1
+     else:
+          print "TEST FAIL!   omaxlast, ominfirst, diclast across a gap."
+     I.splittable( 'ytest3' )
+     I.insert( 'd', 'split', 'ytest3' )
+     gotd = I.select( 0, 'ytest3' )
+     I.deletekid( 4, 'ytest3' )
+     if ( I.source( 'ytest3' ) == 'ytest3_obj' and gotd == 'd'
+          and I.select( 'gap', 'ytest3' ) == 'c'
+          and I.shout( 'COUNT(*)', 'ytest3_pz' ) == 2 ):
+          print "passed test: splittable, then insert, select and delete."
+          ipass += 1
+     else:
+          print "TEST FAIL!   splittable, then insert, select and delete."
+     I.insert( 'g', '#gold', 'ytest3' )
+     I.tagindex( 'ytest3' )
+     I.inbatch( [('e', '#plan agent007#london'), ('f', '#planet #paris')],
+                'ytest3' )
+     tagkids = I.kidcomma( '#plan', 'ytest3' )
+     I.deletecomma( '#paris', 'ytest3' )
+     if ( '_tag' in I.commasub( '#gold', 'ytest3' )[0]
+          and I.select( '#gold', 'ytest3' ) == 'g'
+          and I.select( '#london,agent007', 'ytest3' ) == 'e'
+          and len( tagkids ) == 2 and I.countcomma( '#plan', 'ytest3' ) == 1
+          and I.shout( 'COUNT(*)', 'ytest3_tag' ) == 3 ):
+          print "passed test: tagindex, then insert, select and delete."
+          ipass += 1
+     else:
+          print "TEST FAIL!   tagindex, then insert, select and delete."
+     I.triindex( 'ytest3' )
+     I.insert( 'h', 'agent005 #paris', 'ytest3' )
+     trikids = I.kidcomma( 'agent00[1-7]', 'ytest3' )
+     I.deletecomma( 'agent005', 'ytest3' )
+     I.proceed( "INSERT INTO ytest3_tri (ytest3_tri) VALUES ('integrity-check')" )
+     #  ^raises if the trigram index disagrees with the notes.
+     if ( '_tri' in I.commasub( '#gold,agent00[1-7]', 'ytest3' )[0]
+          and len( trikids ) == 2 and I.select( 'ache', 'ytest3' ) == 'again'
+          and I.countcomma( 'ca', 'ytest3' ) == 1
+          and I.select( 'agent00', 'ytest3' ) == 'e' ):
+          print "passed test: triindex, then insert, select and delete."
+          ipass += 1
+     else:
+          print "TEST FAIL!   triindex, then insert, select and delete."
+     I.ftsindex( 'ytest3' )
+     I.inbatch( [('i', 'Secret plan for Paris'), ('j', 'plan B, plans C')],
+                'ytest3' )
+     ftsdic = I.ftscomma( 'paris,PLAN', 'ytest3' )
+     ranked = [ row[3] for row in I.iterfts( 'plan*', 'ytest3' ) ]
+     I.deletekid( max( ftsdic.keys() ), 'ytest3' )
+     if ( [ v[2] for v in ftsdic.values() ] == [ 'i' ]
+          and sorted( ranked ) == [ 'e', 'i', 'j' ] and ranked[0] == 'j'
+          and len( list( I.iterfts( 'plan*', 'ytest3', 1 ) ) ) == 1
+          and I.ftssub( 'paris', 'ytest3' ) == {} ):
+          print "passed test: ftsindex, then ftscomma, iterfts and delete."
+          ipass += 1
+     else:
+          print "TEST FAIL!   ftsindex, then ftscomma, iterfts and delete."
+     if ( I.commasub( '*,gap', 'ytest3', wild=False )[1][-2:] == [ 'gap', '*' ]
+          and I.select( '*o*,#gold', 'ytest3' ) == 'g' ):
+          print "passed test: commasub puts the rarest term first."
+          ipass += 1
+     else:
+          print "TEST FAIL!   commasub puts the rarest term first."
+     I.ensureindex( 'notes', 'ytest3' )
+     paths, plan = I.explaincomma( 'sch*', 'ytest3', wild=False )
+     if ( paths == [ 'prefix' ] and 'ytest3_notes' in ' '.join( plan )
+          and I.select( comma( 'sch*', 'gap' ), 'ytest3' ) == None
+          and I.omaxcomma( 'sch*', 'ytest3', wild=False ) == 'again' ):
+          print "passed test: ensureindex, then anchored terms use it."
+          ipass += 1
+     else:
+          print "TEST FAIL!   ensureindex, then anchored terms use it."
+     now = int( time.time() )
+     newest = [ row[0] for row in I.iterrange( now - 3600, None, 'ytest3',
+                                                 recentfirst=True ) ]
+     if ( newest == sorted( I.kidsub( '', [], 'ytest3' ), reverse=True )
+          and 'tunix' in I.layout( 'ytest3' )['indexed']
+          and I.countrange( None, now - 3600, 'ytest3' ) == 0
+          and I.dicrange( now + 3600, None, 'ytest3' ) == {} ):
+          print "passed test: iterrange, countrange, dicrange on tunix."
+          ipass += 1
+     else:
+          print "TEST FAIL!   iterrange, countrange, dicrange on tunix."
+     I.KIDCHUNK = 2
+     allkids = I.kidsub( '', [], 'ytest3' )
+     objs, missing = I.getkids( [ allkids[-1], 999, allkids[0] ], 'ytest3' )
+     popped = I.getkids( allkids[:3], 'ytest3', POP=True )[0]
+     del I.KIDCHUNK
+     if ( objs == [ I.getkid( allkids[-1], 'ytest3' ), None, 'again' ]
+          and missing == [ 999 ] and popped[0] == 'again'
+          and I.getkids( allkids[:3], 'ytest3' )[1] == allkids[:3] ):
+          print "passed test: getkids in order, missing reported, POP."
+          ipass += 1
+     else:
+          print "TEST FAIL!   getkids in order, missing reported, POP."
+     I.inbatch( [('p1', 'popq'), ('p2', 'popq'), ('p3', 'popq')], 'ytest4' )
+     pop1 = I.omincomma( 'popq', 'ytest4', POP=True )
+     I.RETURNING = False
+     pop2 = I.omincomma( 'popq', 'ytest4', POP=True )
+     pop3 = [ v[2] for v in I.diccomma( 'popq', 'ytest4', POP=True ).values() ]
+     del I.RETURNING
+     if ( [ pop1, pop2, pop3 ] == [ 'p1', 'p2', [ 'p3' ] ]
+          and I.countcomma( 'popq', 'ytest4' ) == 0 ):
+          print "passed test: atomic POP, with and without RETURNING."
+          ipass += 1
+     else:
+          print "TEST FAIL!   atomic POP, with and without RETURNING."
+     I.droptable( 'ytest4' )
+     Q = Queue( database )
+     Q.TRIES = 2
+     Q.enqueue( [ ('q1', 'job'), ('q2', 'job'), ('q3', 'job') ], 'ytest4' )
+     got1 = Q.dequeue( 2, 'ytest4' )
+     got2 = Q.dequeue( 2, 'ytest4', lease=0 )
+     #  ^only q3 is ready, and its lease expires at once.
+     acked  = Q.ack( [ got1[0][0], got2[0][0] ], 'ytest4' )
+     #  ^the lease of q3 has expired, yet no one took it: still counts.
+     Q.nack( [ got1[1][0] ], 'ytest4' )
+     got3 = Q.dequeue( 5, 'ytest4', lease=0 )
+     got4 = Q.dequeue( 5, 'ytest4' )
+     #  ^q2 delivered a third time, over TRIES: dead-lettered instead.
+     if ( [ g[2] for g in got1 ] == [ 'q1', 'q2' ] and acked == 2
+          and [ g[2] for g in got3 ] == [ 'q2' ] and got4 == []
+          and Q.ack( [ got3[0][0] ], 'ytest4' ) == 0
+          and Q.select( 0, 'ytest4_dead' ) == 'q2' ):
+          print "passed test: Queue lease, ack, nack, dead letter."
+          ipass += 1
+     else:
+          print "TEST FAIL!   Queue lease, ack, nack, dead letter."
+     Q.enqueue( [ ('A', 'job') ], 'ytest4' )
+     stale = Q.dequeue( 1, 'ytest4', lease=0 )[0][0]
+     fresh = Q.dequeue( 1, 'ytest4' )[0][0]
+     Q.ack( [ fresh ], 'ytest4' )
+     Q.enqueue( [ ('B', 'job') ], 'ytest4' )
+     #  ^B reuses the kid of A, the newest row, just acked.
+     staleack = Q.ack( [ stale ], 'ytest4' )
+     gotB = Q.dequeue( 1, 'ytest4' )
+     Q.ack( [ g[0] for g in gotB ], 'ytest4' )
+     for poison in [ 'P1', 'P2' ]:
+          Q.enqueue( [ (poison, 'job') ], 'ytest4' )
+          for i in range( Q.TRIES + 1 ):
+               Q.dequeue( 1, 'ytest4', lease=0 )
+     #  ^each is dead-lettered on its third delivery, both from one kid.
+     dead = Q.dicsub( 'WHERE qkid = ?', [ stale[0] ], 'ytest4_dead' )
+     if ( staleack == 0 and [ g[2] for g in gotB ] == [ 'B' ]
+          and fresh[0] == stale[0] and fresh != stale
+          and sorted( [ v[2] for v in dead.values() ] ) == [ 'P1', 'P2' ] ):
+          print "passed test: Queue receipts and dead letters survive kid reuse."
+          ipass += 1
+     else:
+          print "TEST FAIL!   Queue receipts and dead letters survive kid reuse."
+     producer = threading.Timer( 0.2, Q.enqueue, [ [('late', 'job')], 'ytest4' ] )
+     producer.start()
+     t0 = time.time()
+     gotlate = Q.dequeue( 1, 'ytest4', timeout=10 )
+     waited  = time.time() - t0
+     producer.join()
+     Q.ack( [ g[0] for g in gotlate ], 'ytest4' )
+     t0 = time.time()
+     if ( [ g[2] for g in gotlate ] == [ 'late' ] and waited < 1
+          and Q.fifo( 'ytest4', timeout=0.1 ) == None
+          and time.time() - t0 >= 0.1 ):
+          print "passed test: dequeue and fifo block until commit or timeout."
+          ipass += 1
+     else:
+          print "TEST FAIL!   dequeue and fifo block until commit or timeout."
+     attempts = []
+     def counted( method ):
+          def attempt( *args, **kwargs ):
+               attempts.append( method )
+               return getattr( Queue, method )( Q, *args, **kwargs )
+          return attempt
+     Q.dequeue, Q.ominfirst = counted( 'dequeue' ), counted( 'ominfirst' )
+     try:
+          gotnone  = Q.dequeue( 1, 'ytest4', timeout=0.5 )
+          fifonone = Q.fifo( 'ytest4', timeout=0.5 )
+     finally:
+          del Q.dequeue, Q.ominfirst
+     #  ^on an empty queue, each should be attempted once or twice, not
+     #   thousands of times over, each time taking the write lock.
+     if ( gotnone == [] and fifonone == None
+          and attempts.count( 'dequeue' ) <= 3 and attempts.count( 'ominfirst' ) <= 2 ):
+          print "passed test: blocked dequeue and fifo wait, not spin."
+          ipass += 1
+     else:
+          print "TEST FAIL!   blocked dequeue and fifo wait, not spin."
+     refused = []
+     t0 = time.time()
+     for call in [ lambda s: s.fifo( 'ytest4', timeout=5 ),
+                   lambda s: s.dequeue( 1, 'ytest4', timeout=5 ) ]:
+          try:
+               with Q.session() as s:
+                    call( s )
+          except IOError:
+               refused.append( True )
+     if refused == [ True, True ] and time.time() - t0 < 1:
+          print "passed test: blocking calls refused within a session."
+          ipass += 1
+     else:
+          print "TEST FAIL!   blocking calls refused within a session."
+     Q.enqueue( [ ('low', 'job') ], 'ytest4' )
+     Q.enqueue( [ ('later', 'job') ], 'ytest4', prio=9, delay=60 )
+     Q.enqueue( [ ('high', 'job'), ('high2', 'job') ], 'ytest4', prio=5 )
+     order = [ g[2] for g in Q.dequeue( 5, 'ytest4', lease=0 ) ]
+     moved = Q.reschedule( 'WHERE notes = ?', ['job'], 'ytest4', prio=1 )
+     again = [ g[2] for g in Q.dequeue( 5, 'ytest4' ) ]
+     if ( order == [ 'high', 'high2', 'low' ] and moved == 4
+          and again == [ 'low', 'later', 'high', 'high2' ] ):
+          print "passed test: Queue priority, delay, and reschedule."
+          ipass += 1
+     else:
+          print "TEST FAIL!   Queue priority, delay, and reschedule."
+     Q.droptable( 'ytest4' )
+     Q.enqueue( [ ('s1', 'job'), ('s2', 'job') ], 'ytest4', prio=1 )
+     Q.splittable( 'ytest4' )
+     got1 = Q.dequeue( 1, 'ytest4' )
+     indexes = Q.rows( "SELECT name FROM sqlite_master WHERE tbl_name = 'ytest4'"
+                       " AND type = 'index'" )
+     if ( [ g[2] for g in got1 ] == [ 's1' ] and ( 'ytest4_vis', ) in indexes
+          and [ g[2] for g in Q.dequeue( 5, 'ytest4' ) ] == [ 's2' ] ):
+          print "passed test: splittable keeps queue columns and index."
+          ipass += 1
+     else:
+          print "TEST FAIL!   splittable keeps queue columns and index."
+     Q.droptable( 'ytest4' )
+     print "     Trying deletechunks in windows of 2 kids, then resuming ..."
+     I.inbatch( [ ( i, 'chunk #%s' % ( i % 2 ) ) for i in range( 9 ) ], 'ytest4' )
+     seen = []
+     part = I.deletechunks( 'WHERE notes = ?', [ 'chunk #0' ], 'ytest4',
+                            0, lambda kid, n: seen.append( kid ), 2 )
+     redo = I.deletechunks( 'WHERE notes = ?', [ 'chunk #0' ], 'ytest4',
+                            seen[1], None, 2 )
+     I.inbatch( [ ( 9, 'chunk #9' ) ], 'ytest4' )
+     seen = []
+     last = I.deletechunks( 'WHERE notes = ?', [ 'chunk #9' ], 'ytest4',
+                            0, lambda kid, n: seen.append( kid ), 2 )
+     #  ^a single match: one window at its kid, not a walk from kid 0.
+     I.freshen( 0, 'ytest4', chunk=2 )
+     if ( part == ( 5, 9 ) and redo == ( 0, 4 ) and last == ( 1, 9 )
+          and seen == [ 9 ] and I.countsub( '', [], 'ytest4' ) == 0 ):
+          print "passed test: deletechunks, progress, resume; chunked freshen."
+          ipass += 1
+     else:
+          print "TEST FAIL!   deletechunks, progress, resume; chunked freshen."
+     I.droptable( 'ytest4' )
+     print "     Trying insert with ttl, expire, and Reaper ..."
+     I.insert( 'gone', 'ttl #a', 'ytest4', ttl=-1 )
+     I.insert( 'kept', 'ttl #b', 'ytest4', ttl=3600 )
+     I.insert( 'ever', 'ttl #c', 'ytest4' )
+     live = [ v[2] for v in I.diccomma( 'ttl*', 'ytest4' ).values() ]
+     hidden = ( sorted( live ) == [ 'ever', 'kept' ]
+                and I.countsub( '', [], 'ytest4' ) == 2
+                and I.omincomma( 'ttl*', 'ytest4', POP=True ) == 'kept' )
+     reaped = I.expire( 'ytest4' )
+     I.splittable( 'ytest4' )
+     split = ( I.source( 'ytest4' ) == 'ytest4_live' 
+               and I.select( 'ttl #c', 'ytest4' ) == 'ever'
+               and I.countsub( '', [], 'ytest4' ) == 1 )
+     I.inbatch( [ ( i, 'ttl #d' ) for i in range( 5 ) ], 'ytest4', ttl=-1 )
+     reaper = Reaper( [ ( I.db, 'ytest4' ) ], interval=0.05, n=2 )
+     reaper.start()
+     time.sleep( 0.3 )
+     reaper.stop( 5 )
+     metrics = reaper.metrics()
+     left = Deletion( I.db ).rows( 'SELECT COUNT(*) FROM ytest4' )[0][0]
+     if ( hidden and reaped == 1 and split and left == 1
+          and metrics['reaped'] == 5 and metrics['rate'] > 0 ):
+          print "passed test: insert with ttl, expire, and Reaper."
+          ipass += 1
+     else:
+          print "TEST FAIL!   insert with ttl, expire, and Reaper."
+     I.droptable( 'ytest4' )
+     I.insert( 'old', 'ttl', 'ytest4', ttl=-1 )
+     I.inbatch( [ ( 'b', 'ttl' ), ( 'c', 'ttl' ) ], 'ytest4' )
+     I.insert( 'new', 'ttl', 'ytest4', ttl=-1 )
+     #  ^expired rows, not yet reaped, at either end of the table.
+     ends = ( I.ominfirst( 0, 'ytest4' ), I.omaxlast( 0, 'ytest4' ),
+              sorted( [ v[2] for v in I.diclast( 2, 'ytest4' ).values() ] ),
+              I.fifo( 'ytest4' ), I.fifo( 'ytest4' ), I.fifo( 'ytest4' ) )
+     if ends == ( 'b', 'c', [ 'b', 'c' ], 'b', 'c', None ):
+          print "passed test: positions count only unexpired rows."
+          ipass += 1
+     else:
+          print "TEST FAIL!   positions count only unexpired rows."
+     I.droptable( 'ytest4' )
+     print "     Trying pzdumps codecs and legacy pzloads ..."
+     legacy = zlib.compress( yPickle.dumps( 'legacy', pickle_protocol ) )
+     samples = [ 6, 'repetitive text ' * 500, os.urandom( 50000 ) ]
+     codecs = [ pzdumps( i )[0] for i in samples ]
+     if ( codecs == [ codec_raw, codec_zlib, codec_raw ]
+          and [ pzloads( pzdumps( i ) ) for i in samples ] == samples
+          and pzloads( buffer( pzdumps( samples[1] ) ) ) == samples[1]
+          and pzloads( buffer( legacy ) ) == 'legacy' ):
+          print "passed test: pzdumps codecs raw and zlib, legacy pzloads."
+          ipass += 1
+     else:
+          print "TEST FAIL!   pzdumps codecs raw and zlib, legacy pzloads."
+     print "     Trying captable by rows, then by bytes ..."
+     I.inbatch( [ ( i, 'cap #%s' % i ) for i in range( 5 ) ], 'ytest4' )
+     evicted = I.captable( 'ytest4', maxrows=3 )
+     I.inbatch( [ ( i, 'cap #%s' % i ) for i in range( 5, 9 ) ], 'ytest4' )
+     kidsrows = I.kidsub( '', [], 'ytest4' )
+     blob = os.urandom( 500 )
+     size = len( pzdumps( blob ) )
+     I.captable( 'ytest4', maxbytes=2 * size )
+     I.inbatch( [ ( blob, 'cap #big' ), ( blob, 'cap #big' ) ], 'ytest4' )
+     nbytes = I.rows( 'SELECT bytes FROM ytest4_cap' )[0][0]
+     total = I.rows( 'SELECT SUM( LENGTH( pzblob ) ) FROM ytest4' )[0][0]
+     I.splittable( 'ytest4' )
+     I.inbatch( [ ( blob, 'cap #big' ) ], 'ytest4' )
+     split = I.rows( 'SELECT bytes FROM ytest4_cap' )[0][0] == I.rows(
+                     'SELECT SUM( LENGTH( pzblob ) ) FROM ytest4_pz' )[0][0]
+     if ( evicted == 2 and kidsrows == [ 7, 8, 9 ] and split
+          and I.countsub( '', [], 'ytest4' ) == 2 and nbytes == total <= 2 * size ):
+          print "passed test: captable evicts oldest rows by rows and bytes."
+          ipass += 1
+     else:
+          print "TEST FAIL!   captable evicts oldest rows by rows and bytes."
+     I.droptable( 'ytest4' )
+     I.droptable( 'ytest3' )
      #  print "     (Note: delete* methods v0.50 have passed inspection.)"
      # ================================================================== 
      print "     (Inserted and selected objects should be equivalent.)"
@@ -1907,6 +4497,24 @@ def tester( database=Base.db0 ):
           ipass += 1
      else:
           print "TEST FAIL!   comma2list with wild=True."
+     print "     Trying itercomma, stopping early ..."
+     kids = [ kid for kid, tunix, notes, obj in I.itercomma( 'test', 'ytest' ) ]
+     for kid, tunix, notes, obj in I.itercomma( 'test', 'ytest' ):
+          break
+     dic  = I.diccomma( 'test', 'ytest' )
+     if kids == sorted( dic.keys() ) and obj == dic[ kids[0] ][2]:
+          print "passed test: itercomma in kid order."
+          ipass += 1
+     else:
+          print "TEST FAIL!   itercomma in kid order."
+     notes = I.notescomma( 'test', 'ytest' )
+     if ( I.countcomma( 'test', 'ytest' ) == len( dic )
+          and I.kidcomma( 'test', 'ytest' ) == kids
+          and notes[ kids[0] ] == dic[ kids[0] ][:2] ):
+          print "passed test: countcomma, kidcomma, notescomma."
+          ipass += 1
+     else:
+          print "TEST FAIL!   countcomma, kidcomma, notescomma."
      # ================================================================== 
      print "     (Note: infile v0.50 has passed inspection.)"
      #  Test infile separately since it requires an external file.
@@ -1944,9 +4552,30 @@ def tester( database=Base.db0 ):
      print "VACUUMing the entire database."
      I.clean()
      ipass += 1
+     print "     Trying autovacuum, incremental_vacuum, compact_to ..."
+     I.autovacuum( 'INCREMENTAL' )
+     I.inbatch( [ ( os.urandom( 2000 ), 'vac' ) for i in range( 200 ) ], 'ytest3' )
+     I.droptable( 'ytest3' )
+     free = I.rows( 'PRAGMA freelist_count' )[0][0]
+     step = I.incremental_vacuum( 10 )
+     rest = I.incremental_vacuum()
+     copypath = I.db + '-compact'
+     if os.path.exists( copypath ):
+          os.remove( copypath )
+     I.compact_to( copypath )
+     C = Main( copypath )
+     if ( free > 10 and step == 10 and step + rest == free
+          and I.rows( 'PRAGMA freelist_count' )[0][0] == 0
+          and C.lastkid( 'ytest' ) == I.lastkid( 'ytest' ) ):
+          print "passed test: autovacuum, incremental_vacuum, compact_to."
+          ipass += 1
+     else:
+          print "TEST FAIL!   autovacuum, incremental_vacuum, compact_to."
+     os.remove( copypath )
+     I.autovacuum( 'NONE' )
      print "----------------------------------------------------------------"
      #  print "ipass =", ipass
-     if ipass == 20:
+     if ipass == 52:
           #      ^increment if you added a test ;-)
           print " *** tester    compiled: PASSED -- verify results above. ***"
      else:
@@ -1994,15 +4623,162 @@ def testfarm( dir=Farm.dir0, maxbarns=Farm.barns0, noobs=500 ):
      T.clean(     0, 'ytest' )
      F.cleanfarm( 0, 'ytest' )
      ipass += 1
+     print "Starting background compactor for barns ..."
+     compactor = F.compactor( interval=0.05 )
+     F.plant( 'myobj', 'plant-compactor', 'ytest', testbarn )
+     time.sleep( 0.2 )
+     compactor.stop( 5 )
+     modes = [ Main( F.barn(n) ).rows( 'PRAGMA auto_vacuum' )[0][0]
+               for n in range( F.maxbarns ) if os.path.exists( F.barn(n) ) ]
+     if not F.INLINE and compactor.rounds > 1 and modes == [ 2 ] * len( modes ):
+          print "passed: compactor replaces inline vacuum."
+          ipass += 1
+     else:
+          print "FAIL: compactor replaces inline vacuum."
      print "----------------------------------------------------------------"
      #  print "ipass =", ipass
-     if ipass == 6:
+     if ipass == 7:
           #      ^increment if you added a test ;-)
           print " *** testfarm  compiled: PASSED -- verify results above. ***"
      else:
           print " !!! testfarm   summary: FAILED! -- y_serial BROKEN."
 
 
+
+# ================================ BENCHMARKS ========================================
+
+def benchprofiles( dir='/tmp', noobs=2000 ):
+     '''Benchmark insert and select throughput for each PRAGMA profile.'''
+     #  Same workload per profile on a fresh database file in dir:
+     #  noobs single inserts (one commit each), one inbatch of noobs,
+     #  noobs getkid selects, and a comma select scanning the table.
+     print "\n====================== benchprofiles ==========================="
+     print "  %-12s %12s %12s %12s %12s" % ( 'profile', 'insert/s',
+                                   'inbatch/s', 'getkid/s', 'comma/s' )
+     obj = { 'spam' : range( 20 ), 'eggs' : 'Encode text in UTF-8.' }
+     for profile in [ None ] + sorted( profiles.keys() ):
+          db = os.path.join( dir, 'y_serial-bench-%s.sqlite' % profile )
+          for suffix in [ '', '-wal', '-shm', '-journal' ]:
+               if os.path.exists( db + suffix ):
+                    os.remove( db + suffix )
+          I = Main( db )
+          I.PROFILE = profile
+          rates = []
+          t0 = time.time()
+          for i in range( noobs ):
+               I.insert( obj, 'bench-%s #single' % i, 'ybench' )
+          rates.append( noobs / (time.time() - t0) )
+          t0 = time.time()
+          I.inbatch([ (obj, 'bench-%s #batch' % i) for i in range(noobs) ],
+                      'ybench' )
+          rates.append( noobs / (time.time() - t0) )
+          t0 = time.time()
+          for kid in range( 1, noobs + 1 ):
+               I.getkid( kid, 'ybench' )
+          rates.append( noobs / (time.time() - t0) )
+          t0 = time.time()
+          n = len( I.diccomma( '#batch,bench-1', 'ybench' ) )
+          rates.append( n / (time.time() - t0) )
+          print "  %-12s %12.0f %12.0f %12.0f %12.0f" % tuple( [profile]+rates )
+          pool.clear( db )
+          os.remove( db )
+     print "  (rates in objects per second)"
+
+
+def benchtrigram( dir='/tmp', sizes=( 1000000, 10000000 ), probes=20 ):
+     '''Benchmark infix comma search latency without and with triindex.'''
+     #  For each size, a fresh database of tiny objects whose notes read
+     #  like "agent0123456 #city042 ...".  Each probe counts the rows
+     #  matching one infix term '*gent01234*' (about 100 rows), first by
+     #  scanning the notes, then after Care.triindex.  Building 10M rows
+     #  takes a while (and about a gigabyte) -- start with sizes=(100000,).
+     print "\n====================== benchtrigram ============================"
+     print "  %10s %12s %12s %12s" % ( 'rows', 'scan ms', 'trigram ms',
+                                          'index s' )
+     rand = random.Random( 42 )
+     for size in sizes:
+          db = os.path.join( dir, 'y_serial-bench-%s.sqlite' % size )
+          for suffix in [ '', '-wal', '-shm', '-journal' ]:
+               if os.path.exists( db + suffix ):
+                    os.remove( db + suffix )
+          I = Main( db )
+          I.PROFILE = 'bulk-load'
+          def generate_objnotes():
+               for i in xrange( size ):
+                    notes = 'agent%07d #city%03d %s' % ( rand.randrange( size ),
+                              rand.randrange( 1000 ), rand.choice( [ 'plan',
+                              'report', 'memo', 'cable' ] ) )
+                    yield ( i, notes )
+          I.ingenerator( generate_objnotes(), 'ybench' )
+          terms = [ 'gent%05d' % rand.randrange( size // 100 )
+                    for i in range( probes ) ]
+          lat = []
+          t0 = time.time()
+          for term in terms:
+               I.countcomma( term, 'ybench' )
+          lat.append( 1000 * (time.time() - t0) / probes )
+          t0 = time.time()
+          I.triindex( 'ybench' )
+          index = time.time() - t0
+          t0 = time.time()
+          for term in terms:
+               I.countcomma( term, 'ybench' )
+          lat.append( 1000 * (time.time() - t0) / probes )
+          print "  %10d %12.1f %12.2f %12.1f" % ( size, lat[0], lat[1], index )
+          pool.clear( db )
+          os.remove( db )
+     print "  (latency in milliseconds per query, index build in seconds)"
+
+
+def benchconsumer( db, profile, n ):
+     '''Dequeue and ack batches of n until the queue is empty (benchqueue).'''
+     Q = Queue( db )
+     Q.PROFILE = profile
+     while True:
+          got = Q.dequeue( n, 'ybench' )
+          if not got:
+               break
+          Q.ack( [ g[0] for g in got ], 'ybench' )
+
+def benchqueue( dir='/tmp', noobs=20000, consumers=( 1, 4, 16 ), n=100,
+                                                  profile='throughput' ):
+     '''Benchmark Queue throughput for several consumer processes.'''
+     #  For each number of consumers: enqueue noobs objects, then time
+     #  that many processes draining the queue, n objects per dequeue,
+     #  each batch acked at once.  All share one database file.
+     import multiprocessing
+     print "\n====================== benchqueue =============================="
+     print "  %10s %12s %12s" % ( 'consumers', 'enqueue/s', 'dequeue+ack/s' )
+     obj = { 'spam' : range( 20 ), 'eggs' : 'Encode text in UTF-8.' }
+     db = os.path.join( dir, 'y_serial-bench-queue.sqlite' )
+     for k in consumers:
+          for suffix in [ '', '-wal', '-shm', '-journal' ]:
+               if os.path.exists( db + suffix ):
+                    os.remove( db + suffix )
+          Q = Queue( db )
+          Q.PROFILE = profile
+          t0 = time.time()
+          Q.enqueue( [ (obj, 'bench-%s #queue' % i) for i in range( noobs ) ],
+                     'ybench' )
+          rates = [ noobs / (time.time() - t0) ]
+          pool.clear( db )
+          #  ^no connection shall cross the fork.
+          procs = [ multiprocessing.Process( target=benchconsumer,
+                                             args=( db, profile, n ) )
+                    for i in range( k ) ]
+          t0 = time.time()
+          for p in procs:
+               p.start()
+          for p in procs:
+               p.join()
+          rates.append( noobs / (time.time() - t0) )
+          assert Q.lastkid( 'ybench' ) == 0, " !! benchqueue: not drained."
+          print "  %10d %12.0f %12.0f" % tuple( [k] + rates )
+          pool.clear( db )
+     os.remove( db )
+     print "  (rates in objects per second)"
+
+
 if __name__ == "__main__":
      print "\n  ::  THIS IS A MODULE for import -- not for direct execution! \n"
      raw_input('Enter something to get out: ')